@@ -11,3 +11,4 @@ CONFIGDIR = HOMEDIR / "config"
 SCRIPTDIR = HOMEDIR / "scripts"
 LOG_FILE = "/var/log/ecofreq.log"
 SHM_FILE = "/dev/shm/ecofreq"
+CACHE_DIR = "/var/cache/ecofreq"
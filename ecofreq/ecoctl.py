@@ -32,8 +32,35 @@ def cmd_info(ec, args):
   print("Load:                  ", info.get("idle_load", "NA"))
   print("Power [W]:             ", round(info["avg_power"]))
   print("Frequency [MHz]:       ", round(info["avg_freq"]))
+  for name, s in info.get("power_stats", {}).items():
+    if s["samples"]:
+      print("Power peak/p95 [W]:    ", round(s["peak"], 1), "/", round(s["p95"], 1), "({0}, {1} samples)".format(name, s["samples"]))
+  if info.get("util", None) is not None:
+    print("CPU utilization [%]:   ", round(info["util"], 1))
   print("CO2 intensity [g/kWh]: ", info["last_co2kwh"])     
   print("Energy price [ct/kWh]: ", safe_round(info["last_price"], 3))     
+  if info.get("hot_core", None) is not None:
+    print("Cores power [W]:       ", round(info["cores_power"], 1), "(hottest = CPU{0}, {1} W)".format(info["hot_core"], round(info["hot_core_power"], 1)))
+  a = info.get("actuator_stats", None)
+  if a and a["writes"]:
+    print("Actuator writes:       ", a["writes"], "(skipped = {0}, avg latency = {1} ms, max latency = {2} ms)".format(a["skipped"], 
+          round(a["avg_latency_ms"], 3), round(a["max_latency_ms"], 3)))
+  print("")
+  print("= PROVIDERS =")
+  for metric, s in info.get("provider_status", {}).items():
+    pstr = "{0} ({1}".format(s["provider"], s["state"].upper())
+    if s["failures"]:
+      pstr += ", failures = {0}, last error = {1}".format(s["failures"], s["last_error"])
+    if s["state"] == "open":
+      pstr += ", retry in {0} s".format(s["retry_in"])
+    pstr += ")"
+    if s["source"] and s["source"] != s["provider"]:
+      pstr += ", serving fallback = " + s["source"]
+    if s["age"] is not None:
+      pstr += ", last update = {0} s ago".format(s["age"])
+    if s["stale"]:
+      pstr += ", STALE"
+    print("{0:<23}".format(metric + ":"), pstr)
   print("")
   print("= STATISTICS =")
   ts_start = datetime.strptime(info["start_date"], TS_FORMAT)
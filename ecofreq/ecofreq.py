@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
 import sys 
+import signal
+import json
 from datetime import datetime
 import configparser
 import argparse
@@ -17,6 +19,7 @@ from ecofreq.config import *
 from ecofreq.utils import *
 from ecofreq.ipc import EcoServer
 from ecofreq.monitors.manager import MonitorManager
+from ecofreq.monitors.util import UtilMonitor
 from ecofreq.providers.manager import EcoProviderManager, EcoProvider
 from ecofreq.policy.manager import EcoPolicyManager
 from ecofreq.policy.idle import IdlePolicy
@@ -53,11 +56,19 @@ class EcoFreqController(object):
       res['idle_state'] = "NA"
     res['avg_power'] = self.ef.monitor.get_last_avg_power()
     res['avg_freq'] = self.ef.monitor.get_last_cpu_avg_freq()
+    res['util'] = self.ef.monitor.get_last_util()
+    res['power_stats'] = self.ef.monitor.get_period_power_stats()
     res['total_energy_j'] = self.ef.monitor.get_total_energy()
     res['total_co2'] = self.ef.total_co2
     res['total_cost'] = self.ef.total_cost
     res['last_co2kwh'] = self.ef.last_co2kwh
     res['last_price'] = self.ef.last_price
+    res['provider_status'] = self.ef.co2provider.get_status()
+    res['actuator_stats'] = efh.SysfsWriter.get_stats()
+    if "HotCore" in m_stats:
+      res['hot_core'] = m_stats["HotCore"]
+      res['hot_core_power'] = m_stats["HotCorePower"]
+      res['cores_power'] = m_stats["CoresPower"]
 
   def get_policy(self, res, args):
     res['co2policy'] = self.ef.co2policy.get_config()
@@ -78,6 +89,7 @@ class EcoFreqController(object):
 #    print(new_cfg)
     self.ef.co2policy.set_config(new_cfg)
     if self.ef.last_co2_data:
+      self.ef.co2policy.update_forecast(self.ef.co2provider)
       self.ef.co2policy.set_co2(self.ef.last_co2_data)
     self.ef.co2logger.print_cmd("set_policy")
 
@@ -129,6 +141,7 @@ class EcoLogger(object):
     self.fmt = NAFormatter()
     self.idle_fields = False
     self.idle_debug = False
+    self.util_fields = False
     self.cost_fields = config["general"].get("logcost", True)
     self.co2_extra = config["general"].get("logco2extra", False)
     
@@ -136,6 +149,8 @@ class EcoLogger(object):
     if monitors.get_period_idle():
       self.idle_fields = True
 #      self.idle_debug = True
+    if monitors.get_by_class(UtilMonitor):
+      self.util_fields = True
     self.row_fmt = '{:<20}\t{:>10}\t{:>10}\t{:>10}\t{:>12.3f}\t{:>12.3f}\t{:>12.3f}\t{:>10.3f}\t{:>10.3f}'
     if self.idle_fields:
       self.row_fmt += "\t{:<7}"
@@ -145,6 +160,8 @@ class EcoLogger(object):
       self.row_fmt += "\t{:>10}\t{:>8.3f}\t{:>10}"
     if self.cost_fields:
       self.row_fmt += "\t{:>8.3f}\t{:>8.3f}"
+    if self.util_fields:
+      self.row_fmt += "\t{:>8.3f}"
           
     self.header_fmt = "#" + self.row_fmt.replace(".3f", "")
 
@@ -164,6 +181,8 @@ class EcoLogger(object):
       headers += ["CI [g/kWh]", "Fossil [%]", "Index"]
     if self.cost_fields:
       headers += ["Price/kWh", "Cost"]
+    if self.util_fields:
+      headers += ["Util [%]"] 
     self.log(self.fmt.format(self.header_fmt, *headers))
 
   def print_row(self, co2kwh, period_price, avg_freq, energy, avg_power, co2period, period_cost, idle, stats, co2_data):
@@ -186,6 +205,8 @@ class EcoLogger(object):
       cols += [safe_round(co2_data.get(EcoProvider.FIELD_CO2)), co2_data.get(EcoProvider.FIELD_FOSSIL_PCT), co2_data.get(EcoProvider.FIELD_INDEX)]
     if self.cost_fields:
       cols += [period_price, period_cost]
+    if self.util_fields:
+      cols += [stats.get("PeriodUtil")]
       
     logstr = self.fmt.format(self.row_fmt, *cols)
 
@@ -208,7 +229,9 @@ class EcoFreq(object):
     self.co2logger = EcoLogger(config)
     self.monitor = MonitorManager(config)
     self.co2logger.init_fields(self.monitor)
+    self.co2policy.init_monitors(self.monitor)
     self.debug = False
+    self.refresh_task = None
     self.idle_policy = IdlePolicy.from_config(config)
     if self.idle_policy:
       self.idle_policy.init_monitors(self.monitor)
@@ -224,8 +247,9 @@ class EcoFreq(object):
       self.mqtt_logger = None
     
     # make sure that CO2 sampling interval is a multiple of energy sampling interval
-    self.sample_interval = self.monitor.adjust_interval(self.co2provider.interval)
+    self.sample_interval = self.monitor.adjust_interval(self.co2provider.tick)
     # print("sampling intervals co2/energy:", self.co2provider.interval, self.sample_interval)
+    self.co2provider.update()
     self.last_co2_data = self.co2provider.get_data()
     self.last_co2kwh = self.last_co2_data.get(EcoProvider.FIELD_CO2, None)
     self.last_price = self.last_co2_data.get(EcoProvider.FIELD_PRICE, None)
@@ -257,11 +281,19 @@ class EcoFreq(object):
     
   def reset_co2provider(self, cfg):
     self.co2provider = EcoProviderManager(cfg)
+    self.sample_interval = self.monitor.adjust_interval(self.co2provider.tick)
     self.co2provider_updated = True
     self.co2logger.print_cmd("set_provider")
     
+  def update_policy(self):
+    # apply policy as soon as a fresh value arrives, without waiting for the next accounting period
+    co2_data = self.co2provider.get_data()
+    self.co2policy.update_forecast(self.co2provider)
+    self.co2policy.set_co2(co2_data)
+    self.last_co2_data = co2_data
+
   def update_co2(self):
-    # fetch new co2 intensity 
+    # get freshest co2 intensity and price values
     co2_data = self.co2provider.get_data()
     co2 = co2_data.get(EcoProvider.FIELD_CO2, None)
     if co2:
@@ -304,6 +336,8 @@ class EcoFreq(object):
     self.co2logger.print_row(self.period_co2kwh, self.period_price, avg_freq, energy, avg_power, period_co2, period_cost, idle, stats, co2_data) 
 
     # apply policy for new co2 reading
+    self.co2policy.set_totals({"co2": self.total_co2, "cost": self.total_cost})
+    self.co2policy.update_forecast(self.co2provider)
     self.co2policy.set_co2(co2_data)
 
     if co2:
@@ -349,14 +383,21 @@ class EcoFreq(object):
         await asyncio.sleep(to_sleep)
         duration += self.sample_interval
         t1 = datetime.now()
+        efh.HwTopology.check_hotplug()
         self.monitor.update(duration)
-        do_update_co2 = duration % self.co2provider.interval == 0 
         if self.co2provider_updated:
+          self.co2provider.update()
           do_update_co2 = True
           self.co2provider_updated = False
+        else:
+          prov_updated = self.co2provider.update(duration)
+          do_update_co2 = duration % self.co2provider.interval == 0 
         if do_update_co2:
           self.update_co2()
           self.monitor.reset_period() 
+        elif prov_updated:
+          self.update_policy()
+        self.co2policy.tick()
         self.write_shm()  
         self.write_mqtt()
         if self.idle_policy:
@@ -364,6 +405,8 @@ class EcoFreq(object):
             self.monitor.update(0)
             self.monitor.reset_period()
             self.co2logger.print_cmd("wakeup")
+            # firmware might have reset frequency/power limits during suspend
+            efh.SysfsWriter.invalidate_all()
             t1 = datetime.now()
         elapsed = (datetime.now() - t1).total_seconds()
 #        print("elapsed:", elapsed)
@@ -371,12 +414,37 @@ class EcoFreq(object):
       e = sys.exc_info()
       print ("Exception: ", e)
       self.co2policy.reset()
-      
+
+  def on_sighup(self, loop):
+    # probes may call slow external tools (e.g. ipmitool) -> do not block the event loop
+    if self.refresh_task and not self.refresh_task.done():
+      return
+    self.refresh_task = loop.run_in_executor(None, efh.CapabilityProbe.reprobe)
+    # new topology is activated in the loop thread, so that readers are not closed while in use
+    self.refresh_task.add_done_callback(self.on_reprobe)
+
+  def on_reprobe(self, fut):
+    if fut.cancelled():
+      return
+    if fut.exception():
+      print("ERROR: Capability probing failed:", fut.exception())
+      return
+    efh.HwTopology.swap(fut.result())
+
   async def main(self):
+    # re-probe hardware topology and capabilities on SIGHUP 
+    loop = asyncio.get_running_loop()
+    loop.add_signal_handler(signal.SIGHUP, self.on_sighup, loop)
+    # event-driven monitors, e.g. PSI triggers
+    self.monitor.attach(loop)
     spins = [self.server.spin(), MQTTManager.run(), self.spin()]
     tasks = [asyncio.create_task(t) for t in spins]
-    for t in tasks:
-      await t
+    try:
+      for t in tasks:
+        await t
+    finally:
+      # stop background samplers
+      self.monitor.stop()
       
 def cmd_install(args):
   EcofreqInstaller.install(args)
@@ -385,7 +453,11 @@ def cmd_remove(args):
   EcofreqInstaller.uninstall(args)
 
 def cmd_info(args):
-  print_sysinfo()
+  efh.CapabilityProbe.init()
+  if args.json:
+    print(json.dumps(efh.CapabilityProbe.get_sysinfo(), indent=2))
+  else:
+    print_sysinfo()
 
 def cmd_showcfg(args):
   parser = read_config(args)
@@ -425,6 +497,8 @@ def parse_args():
   )
   info_parser.add_argument("--sudo", dest="usermode", action="store_false", 
                       help="Run in rootful mode (elevate with sudo if needed)")
+  info_parser.add_argument("--json", dest="json", action="store_true", 
+                      help="Print system info in JSON format")
   info_parser.set_defaults(func=cmd_info, usermode=True)  
 
   showcfg_parser = subparsers.add_parser(
@@ -510,6 +584,7 @@ def main():
 
   # normal startup
   try:
+    efh.CapabilityProbe.init()
     print_sysinfo()
 
     cfg = read_config(args)
@@ -525,6 +600,7 @@ def main():
   except:
     print("Exception:", traceback.format_exc())
     
+  efh.SysfsWriter.close_all()
   if os.path.exists(SHM_FILE):
     os.remove(SHM_FILE)
     
@@ -6,5 +6,8 @@ from ecofreq.helpers.suspend import SuspendHelper
 from ecofreq.helpers.ipmi import IPMIHelper
 from ecofreq.helpers.docker import DockerHelper
 from ecofreq.helpers.geo import GeoHelper
+from ecofreq.helpers.sysfs import SysfsWriter
+from ecofreq.helpers.topology import HwTopology
+from ecofreq.helpers.probe import CapabilityProbe
 
 __all__ = [ "cpu", "cgroup" ]
\ No newline at end of file
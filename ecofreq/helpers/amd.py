@@ -1,21 +1,25 @@
 import sys
 import os.path
-from subprocess import check_output,DEVNULL,CalledProcessError
+from subprocess import check_output,DEVNULL,CalledProcessError,TimeoutExpired
 
 from ecofreq.utils import read_int_value
 from .cpu import CpuInfoHelper
+from .topology import HwTopology
+from .msr import MsrReader
 
 class AMDEsmiHelper(object):
   CMD_ESMI_TOOL="/opt/e-sms/e_smi/bin/e_smi_tool"
   MAX_PLIMIT_LABEL="PowerLimitMax (Watts)"
   CUR_PLIMIT_LABEL="PowerLimit (Watts)"
   UWATT, MWATT, WATT = 1e-6, 1e-3, 1
+  # sec
+  TIMEOUT = 10
  
   @classmethod
   def run_esmi(cls, params, parse_out=True):
     cmdline = cls.CMD_ESMI_TOOL + " " + params 
     try:
-      out = check_output(cmdline, shell=True, stderr=DEVNULL, universal_newlines=True)
+      out = check_output(cmdline, shell=True, stderr=DEVNULL, universal_newlines=True, timeout=cls.TIMEOUT)
     except CalledProcessError as e:
       if e.returncode == 210:
         out = e.output
@@ -34,10 +38,14 @@ class AMDEsmiHelper(object):
 
   @classmethod
   def available(cls):
+    return HwTopology.get().cached("esmi", cls.probe)
+
+  @classmethod
+  def probe(cls):
     try:
       out = cls.run_esmi("-v")
       return True
-    except CalledProcessError:
+    except (CalledProcessError, TimeoutExpired):
       return False
 
   @classmethod
@@ -119,7 +127,9 @@ class AMDEsmiHelper(object):
 # https://github.com/amanusk/s-tui/commit/5c87727f5a2364697bfce84a0b688c1a6d2b3250
 class AMDRaplMsrHelper(object):
   MSR_CPU_PATH="/dev/cpu/{0}/msr"
+  MSR_STRIDE=1
   TOPOL_CPU_PATH="/sys/devices/system/cpu/cpu{0}/topology/physical_package_id"
+  TOPOL_CORE_PATH="/sys/devices/system/cpu/cpu{0}/topology/core_id"
   CPU_MAX = 4096
   UNIT_MSR = 0xC0010299
   CORE_MSR = 0xC001029A
@@ -136,25 +146,48 @@ class AMDRaplMsrHelper(object):
     return res
 
   @classmethod
-  def package_list(cls):
-    pkg_list = set()
+  def pkg_cpu_map(cls):
+    return HwTopology.get().cached("amd_msr_pkg_map", cls.scan_pkg_cpu_map)
+
+  @classmethod
+  def scan_pkg_cpu_map(cls):
+    # package -> first CPU of this package
+    pkg_map = {}
     for cpu in range(cls.CPU_MAX):
       fname = cls.TOPOL_CPU_PATH.format(cpu)
       if not os.path.isfile(fname):
         break
       pkg = read_int_value(fname)
-      pkg_list.add(pkg)
-    return list(pkg_list)
+      if pkg not in pkg_map:
+        pkg_map[pkg] = cpu
+    return pkg_map
+
+  @classmethod
+  def package_list(cls):
+    return sorted(cls.pkg_cpu_map().keys())
 
   @classmethod
   def pkg_to_cpu(cls, pkg):
+    return cls.pkg_cpu_map().get(pkg, None)
+
+  @classmethod
+  def core_list(cls):
+    return HwTopology.get().cached("amd_msr_cores", cls.scan_core_list)
+
+  @classmethod
+  def scan_core_list(cls):
+    # first CPU (thread) of every physical core: core energy MSR is shared by SMT siblings
+    cores = {}
     for cpu in range(cls.CPU_MAX):
       fname = cls.TOPOL_CPU_PATH.format(cpu)
       if not os.path.isfile(fname):
-        break;
-      if read_int_value(fname) == cpu:
-        return cpu
-    return None
+        break
+      core_fname = cls.TOPOL_CORE_PATH.format(cpu)
+      core = read_int_value(core_fname) if os.path.isfile(core_fname) else cpu
+      key = (read_int_value(fname), core)
+      if key not in cores:
+        cores[key] = cpu
+    return sorted(cores.values())
 
   @classmethod
   def cpu_msr_file(cls, cpu):
@@ -164,12 +197,15 @@ class AMDRaplMsrHelper(object):
   def pkg_msr_file(cls, pkg):
     cpu = cls.pkg_to_cpu(pkg)
     return cls.cpu_msr_file(cpu)
-  
+
   @classmethod
-  def get_energy_factor(cls, filename):
-    unit_msr = cls.read_msr(filename, cls.UNIT_MSR)
+  def unit_to_energy_factor(cls, unit_msr):
     energy_factor = 0.5 ** ((unit_msr & cls.ENERGY_UNIT_MASK) >> 8)
     return energy_factor * cls.UJOULE_IN_JOULE
+  
+  @classmethod
+  def get_energy_factor(cls, filename):
+    return cls.unit_to_energy_factor(cls.read_msr(filename, cls.UNIT_MSR))
 
   @classmethod
   def get_energy_range(cls, filename):
@@ -183,10 +219,18 @@ class AMDRaplMsrHelper(object):
     # print ("amd pkg_energy: ", energy)
     return energy
 
+  @classmethod
+  def package_reader(cls):
+    return HwTopology.get().cached("amd_msr_pkg_reader", 
+                                   lambda: AMDRaplMsrReader([cls.pkg_to_cpu(p) for p in cls.package_list()], cls.PACKAGE_MSR))
+
+  @classmethod
+  def core_reader(cls):
+    return HwTopology.get().cached("amd_msr_core_reader", lambda: AMDRaplMsrReader(cls.core_list(), cls.CORE_MSR))
+
   @classmethod
   def get_package_energy(cls, pkg):
-    filename = cls.pkg_msr_file(pkg)
-    return cls.get_energy(filename, cls.PACKAGE_MSR)
+    return cls.package_reader().read_energy_one(cls.package_list().index(pkg))
 
   @classmethod
   def get_core_energy(cls, cpu):
@@ -195,10 +239,32 @@ class AMDRaplMsrHelper(object):
 
   @classmethod
   def get_package_energy_range(cls, pkg):
-    filename = cls.pkg_msr_file(pkg)
-    return cls.get_energy_range(filename)
+    return cls.package_reader().energy_range[cls.package_list().index(pkg)]
 
   @classmethod
   def get_core_energy_range(cls, cpu):
     filename = cls.cpu_msr_file(cpu)
     return cls.get_energy_range(filename)
+
+class AMDRaplMsrReader(object):
+  # energy counters (in uJ) of a set of CPUs, read through persistent MSR fds
+  def __init__(self, cpus, register):
+    self.register = register
+    self.msr = MsrReader(cpus, AMDRaplMsrHelper.MSR_CPU_PATH, AMDRaplMsrHelper.MSR_STRIDE)
+    # energy unit is fixed for the lifetime of the system -> read only once
+    self.factors = []
+    for unit_msr in self.msr.read_msr_all(AMDRaplMsrHelper.UNIT_MSR):
+      if unit_msr is None:
+        raise OSError("Cannot read energy unit MSR")
+      self.factors.append(AMDRaplMsrHelper.unit_to_energy_factor(unit_msr))
+    self.energy_range = [AMDRaplMsrHelper.ENERGY_STATUS_MASK * f for f in self.factors]
+
+  def close(self):
+    self.msr.close()
+
+  def read_energy_one(self, i):
+    val = self.msr.read_msr(i, self.register)
+    return (val & AMDRaplMsrHelper.ENERGY_STATUS_MASK) * self.factors[i] if val is not None else None
+
+  def read_energy(self):
+    return [self.read_energy_one(i) for i in range(len(self.factors))]
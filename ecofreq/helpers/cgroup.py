@@ -1,10 +1,15 @@
 from ecofreq.utils import *
+from ecofreq.helpers.topology import HwTopology
 
 class LinuxCgroupHelper(object):
   CGROUP_FS_PATH="/sys/fs/cgroup/"
 
   @classmethod
   def available(cls):
+    return HwTopology.get().cached("cgroup", cls.probe)
+
+  @classmethod
+  def probe(cls):
     return os.path.exists(cls.CGROUP_FS_PATH)
   
   @classmethod
@@ -156,7 +161,7 @@ class LinuxCgroupV2Helper(LinuxCgroupHelper):
     if not period:
       period = old_period
     if not isinstance(quota, str):
-      quota = quota * int(period)
+      quota = int(quota * int(period))
 #    print(quota, period)  
     write_value(fname, quota)
 
@@ -1,16 +1,20 @@
 import os.path
+import glob
 from subprocess import call,check_output,DEVNULL,CalledProcessError
 
 from ecofreq.utils import *
 from ecofreq.config import DATADIR
+from ecofreq.helpers.sysfs import SysfsWriter, SysfsReader
+from ecofreq.helpers.topology import HwTopology
 
 class CpuInfoHelper(object):
   CMD_LSCPU = "lscpu"
   CPU_TDP_FILE = DATADIR / "cpu_tdp.csv"
+  TOPOL_PKG_PATH = "/sys/devices/system/cpu/cpu{0}/topology/physical_package_id"
   
   @classmethod
   def available(cls):
-    return call(cls.CMD_LSCPU, shell=True, stderr=DEVNULL) == 0
+    return HwTopology.get().threads > 0
 
   @classmethod
   def parse_lscpu(cls):
@@ -27,20 +31,34 @@ class CpuInfoHelper(object):
 
   @classmethod
   def get_cores(cls):
-    cpuinfo = cls.parse_lscpu()
-    threads = int(cpuinfo["CPU(s)"])
-    cores = int(threads / int(cpuinfo["Thread(s) per core"]))
-    return cores
+    return HwTopology.get().cores
 
   @classmethod
   def get_sockets(cls):
-    cpuinfo = cls.parse_lscpu()
-    return int(cpuinfo["Socket(s)"])
+    return HwTopology.get().sockets
     
+  @classmethod
+  def get_cpu_packages(cls):
+    return HwTopology.get().cached("cpu_pkg_map", cls.scan_cpu_packages)
+
+  @classmethod
+  def scan_cpu_packages(cls):
+    # cpu -> physical package
+    pkg_map = {}
+    for fname in glob.glob(cls.TOPOL_PKG_PATH.format("[0-9]*")):
+      cpu = int(fname.split("/")[-3][3:])
+      pkg_map[cpu] = read_int_value(fname)
+    return pkg_map
+
   @classmethod
   def get_tdp_uw(cls):
-    cpuinfo = cls.parse_lscpu()
-    mymodel = cpuinfo["Model name"]
+    return HwTopology.get().cached("tdp", cls.lookup_tdp_uw)
+
+  @classmethod
+  def lookup_tdp_uw(cls):
+    mymodel = HwTopology.get().model
+    if not mymodel:
+      return None
     mymodel = mymodel.split(" with ")[0]
     mycpu_toks = []
     for w in mymodel.split(" "):
@@ -61,14 +79,10 @@ class CpuInfoHelper(object):
 
   @classmethod
   def info(cls):
-    cpuinfo = cls.parse_lscpu()
-    if cpuinfo:
-      model = cpuinfo["Model name"]
-      sockets = int(cpuinfo["Socket(s)"])
-      threads = int(cpuinfo["CPU(s)"])
-      cores = int(threads / int(cpuinfo["Thread(s) per core"]))
-      print("CPU model:                ", model) 
-      print("CPU sockets/cores/threads:", sockets, "/", cores, "/", threads) 
+    topo = HwTopology.get()
+    if topo.threads:
+      print("CPU model:                ", topo.model) 
+      print("CPU sockets/cores/threads:", topo.sockets, "/", topo.cores, "/", topo.threads) 
     else:
       print("CPU info not available")
   
@@ -80,9 +94,21 @@ class CpuFreqHelper(object):
   def cpu_field_fname(cls, cpu, field):
     return cls.SYSFS_CPU_PATH.format(cpu, field)
 
+  @classmethod
+  def cpu_list(cls):
+    # CPUs with cpufreq support
+    return HwTopology.get().cached("cpufreq_cpus", cls.scan_cpu_list)
+
+  @classmethod
+  def scan_cpu_list(cls):
+    cpus = []
+    for d in glob.glob(cls.SYSFS_CPU_PATH.format("[0-9]*", "")):
+      cpus.append(int(d.split("/")[-3][len("cpu"):]))
+    return sorted(cpus)
+
   @classmethod
   def available(cls):
-    return os.path.isfile(cls.cpu_field_fname(0, "scaling_driver"))
+    return cls.get_driver() is not None
   
   @classmethod
   def info(cls):
@@ -119,7 +145,11 @@ class CpuFreqHelper(object):
 
   @classmethod
   def get_driver(cls):
-    if cls.available():
+    return HwTopology.get().cached("cpufreq_driver", cls.probe_driver)
+
+  @classmethod
+  def probe_driver(cls):
+    if os.path.isfile(cls.cpu_field_fname(0, "scaling_driver")):
       return cls.get_string("scaling_driver").strip()
     else:
       return None
@@ -154,26 +184,19 @@ class CpuFreqHelper(object):
 
   @classmethod
   def get_avg_gov_cur_freq(cls, unit=KHZ):  
-    cpu = 0
-    fsum = 0
-    while True:
-      fcpu = cls.get_gov_cur_freq(cpu, unit)
-      if fcpu:
-        fsum += fcpu
-        cpu += 1
-      else:
-        break
-    return fsum / cpu
+    reader = HwTopology.get().cached("cpufreq_reader", 
+                                     lambda: SysfsReader([cls.cpu_field_fname(cpu, "scaling_cur_freq") for cpu in cls.cpu_list()]))
+    freqs = reader.read_ints()
+    return sum(freqs) / len(freqs) / unit if len(freqs) else 0
 
   @classmethod
   def set_cpu_field_value(cls, cpu, field, value):  
-    return write_value(cls.cpu_field_fname(cpu, field), value)
+    return SysfsWriter.write_value(cls.cpu_field_fname(cpu, field), value)
     
   @classmethod
   def set_field_value(cls, field, value):  
-    cpu = 0
-    while cls.set_cpu_field_value(cpu, field, value):
-      cpu += 1
+    for cpu in cls.cpu_list():
+      cls.set_cpu_field_value(cpu, field, value)
 
   @classmethod
   def set_gov_max_freq(cls, freq):
@@ -203,6 +226,10 @@ class LinuxPowercapHelper(object):
 
   @classmethod
   def package_list(cls, domain="package-"):
+    return HwTopology.get().cached("rapl_" + domain, lambda: cls.scan_package_list(domain))
+
+  @classmethod
+  def scan_package_list(cls, domain):
     l = []
     pkg = 0
     while pkg < cls.PKG_MAX:
@@ -297,7 +324,7 @@ class LinuxPowercapHelper(object):
   @classmethod
   def set_package_power_limit(cls, pkg, power, unit=UWATT):
     val = round(power * unit)
-    write_value(cls.package_file(pkg, "constraint_0_power_limit_uw"), val)
+    SysfsWriter.write_value(cls.package_file(pkg, "constraint_0_power_limit_uw"), val)
 
   @classmethod
   def reset_package_power_limit(cls, pkg):
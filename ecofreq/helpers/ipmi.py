@@ -1,8 +1,17 @@
-from subprocess import check_output,DEVNULL,CalledProcessError
+from subprocess import check_output,DEVNULL,CalledProcessError,TimeoutExpired
+
+from ecofreq.helpers.topology import HwTopology
 
 class IPMIHelper(object):
+  # sec, some BMCs are really slow
+  TIMEOUT = 15
+
   @classmethod
   def available(cls):
+    return HwTopology.get().cached("ipmi", cls.probe)
+
+  @classmethod
+  def probe(cls):
     return cls.get_power() is not None
 
   @classmethod
@@ -16,12 +25,12 @@ class IPMIHelper(object):
   @classmethod
   def get_power(cls):
     try:
-      out = check_output("ipmitool dcmi power reading", shell=True, stderr=DEVNULL, universal_newlines=True)
+      out = check_output("ipmitool dcmi power reading", shell=True, stderr=DEVNULL, universal_newlines=True, timeout=cls.TIMEOUT)
       for line in out.split("\n"):
         tok = [x.strip() for x in line.split(":")]
         if tok[0] == "Instantaneous power reading":
           pwr = tok[1].split()[0]
           return float(pwr)
       return None
-    except CalledProcessError:
+    except (CalledProcessError, TimeoutExpired):
       return None
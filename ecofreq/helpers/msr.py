@@ -0,0 +1,25 @@
+import sys
+import errno
+
+from ecofreq.helpers.sysfs import SysfsReader
+
+class MsrReader(SysfsReader):
+  MSR_CPU_PATH="/dev/cpu/{0}/msr"
+  MSR_SIZE=8
+  # CPU went offline
+  REOPEN_ERRORS = SysfsReader.REOPEN_ERRORS + [errno.ENXIO]
+
+  # /dev/cpu/N/msr files of the given CPUs, opened once; register address = file offset / stride
+  # (stride=MSR_SIZE allows to use plain files as fake MSR devices for testing)
+  def __init__(self, cpus, path=None, stride=1):
+    self.cpus = list(cpus)
+    self.stride = stride
+    path = path or self.MSR_CPU_PATH
+    SysfsReader.__init__(self, [path.format(cpu) for cpu in self.cpus])
+
+  def read_msr(self, i, register):
+    s = self.read(i, self.MSR_SIZE, register * self.stride)
+    return int.from_bytes(s, sys.byteorder) if s else None
+
+  def read_msr_all(self, register):
+    return [self.read_msr(i, register) for i in range(len(self.fnames))]
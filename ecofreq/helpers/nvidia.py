@@ -1,22 +1,30 @@
-from subprocess import check_output,DEVNULL,CalledProcessError
+from subprocess import check_output,DEVNULL,CalledProcessError,TimeoutExpired
+
+from ecofreq.helpers.topology import HwTopology
 
 class NvidiaGPUHelper(object):
   CMD_NVSMI = "nvidia-smi"
+  # sec
+  TIMEOUT = 10
 
   @classmethod
   def available(cls):
+    return HwTopology.get().cached("nvidia_gpus", cls.probe)
+
+  @classmethod
+  def probe(cls):
 #   return call(cls.CMD_NVSMI, shell=True, stdout=DEVNULL, stderr=DEVNULL) == 0
     try:
       out = cls.query_gpus(fields = "power.draw,power.management")
 #      print (out)
       return "Enabled" in out[0][1]
-    except CalledProcessError:
+    except (CalledProcessError, TimeoutExpired):
       return False
 
   @classmethod
   def query_gpus(cls, fields, fmt = "csv,noheader,nounits", qcmd="--query-gpu"):
     cmdline = cls.CMD_NVSMI + " --format=" + fmt +  " " + qcmd + "=" + fields 
-    out = check_output(cmdline, shell=True, stderr=DEVNULL, universal_newlines=True)
+    out = check_output(cmdline, shell=True, stderr=DEVNULL, universal_newlines=True, timeout=cls.TIMEOUT)
     result = []
     for line in out.split("\n"):
       if line:
@@ -0,0 +1,142 @@
+import os
+import json
+from concurrent.futures import ThreadPoolExecutor, wait
+
+from ecofreq import __version__
+from ecofreq.config import CACHE_DIR
+from ecofreq.helpers.topology import HwTopology
+from ecofreq.helpers.cpu import CpuInfoHelper, CpuFreqHelper, LinuxPowercapHelper
+from ecofreq.helpers.amd import AMDEsmiHelper
+from ecofreq.helpers.nvidia import NvidiaGPUHelper
+from ecofreq.helpers.ipmi import IPMIHelper
+from ecofreq.helpers.cgroup import LinuxCgroupHelper
+from ecofreq.helpers.suspend import SuspendHelper
+
+class CapabilityProbe(object):
+  CACHE_FILE = os.path.join(CACHE_DIR, "capabilities.json")
+  BOOT_ID_FILE = "/proc/sys/kernel/random/boot_id"
+  # sec, overall deadline for all probes (external tools have their own timeouts as well)
+  TIMEOUT = 20
+  # topology cache key -> (probe function, fallback value if probe fails or times out)
+  PROBES = {"tdp":              (CpuInfoHelper.lookup_tdp_uw, None),
+            "cpufreq_driver":   (CpuFreqHelper.probe_driver, None),
+            "rapl_package-":    (lambda: LinuxPowercapHelper.scan_package_list("package-"), []),
+            "rapl_dram":        (lambda: LinuxPowercapHelper.scan_package_list("dram"), []),
+            "rapl_psys":        (lambda: LinuxPowercapHelper.scan_package_list("psys"), []),
+            "esmi":             (AMDEsmiHelper.probe, False),
+            "nvidia_gpus":      (NvidiaGPUHelper.probe, False),
+            "ipmi":             (IPMIHelper.probe, False),
+            "cgroup":           (LinuxCgroupHelper.probe, False),
+            "suspend":          (SuspendHelper.probe, False),
+           }
+  # last probe run: key -> source ("cache", "probe", "timeout", "error")
+  STATUS = {}
+  HwTopology.STATIC_CAPS.update(PROBES.keys())
+
+  @classmethod
+  def cache_key(cls):
+    try:
+      with open(cls.BOOT_ID_FILE) as f:
+        boot_id = f.read().strip()
+    except OSError:
+      boot_id = None
+    # results of some probes (e.g. IPMI) depend on privileges
+    return {"boot_id": boot_id, "kernel": os.uname().release, "version": __version__, "uid": os.getuid()}
+
+  @classmethod
+  def load_cache(cls):
+    try:
+      with open(cls.CACHE_FILE) as f:
+        data = json.load(f)
+      if data.get("key") == cls.cache_key():
+        return data.get("caps", {})
+    except (OSError, ValueError):
+      pass
+    return None
+
+  @classmethod
+  def store_cache(cls, caps):
+    data = {"key": cls.cache_key(), "caps": caps}
+    try:
+      os.makedirs(os.path.dirname(cls.CACHE_FILE), exist_ok=True)
+      tmp_fname = cls.CACHE_FILE + ".tmp"
+      with open(tmp_fname, "w") as f:
+        json.dump(data, f)
+      os.replace(tmp_fname, cls.CACHE_FILE)
+    except OSError:
+      # no write permission (e.g. user mode) -> probe again next time
+      pass
+
+  @classmethod
+  def clear_cache(cls):
+    try:
+      os.remove(cls.CACHE_FILE)
+    except OSError:
+      pass
+
+  @classmethod
+  def run_probes(cls, keys):
+    caps = {}
+    complete = True
+    ex = ThreadPoolExecutor(max_workers=len(keys))
+    futures = {key: ex.submit(cls.PROBES[key][0]) for key in keys}
+    wait(futures.values(), timeout=cls.TIMEOUT)
+    for key, fut in futures.items():
+      if not fut.done():
+        # give up on hanging probe, but do not block startup any longer
+        cls.STATUS[key] = "timeout"
+        caps[key] = cls.PROBES[key][1]
+        complete = False
+      elif fut.exception():
+        cls.STATUS[key] = "error"
+        caps[key] = cls.PROBES[key][1]
+      else:
+        cls.STATUS[key] = "probe"
+        caps[key] = fut.result()
+    ex.shutdown(wait=False)
+    return caps, complete
+
+  @classmethod
+  def init(cls, use_cache=True):
+    # make sure that shared topology is built before probe threads start
+    return cls.probe_topology(HwTopology.get(), use_cache)
+
+  @classmethod
+  def probe_topology(cls, topo, use_cache=True):
+    caps = cls.load_cache() if use_cache else None
+    if caps is not None and set(caps.keys()) >= set(cls.PROBES.keys()):
+      cls.STATUS = {key: "cache" for key in caps}
+    else:
+      caps, complete = cls.run_probes(list(cls.PROBES.keys()))
+      # do not persist incomplete results, e.g. BMC was not responding
+      if complete:
+        cls.store_cache(caps)
+    topo.caps.update(caps)
+    return caps
+
+  @classmethod
+  def reprobe(cls):
+    # -> new topology with fresh probe results; not shared yet, so it is safe to run this in a worker thread
+    topo = HwTopology()
+    cls.clear_cache()
+    cls.probe_topology(topo, use_cache=False)
+    return topo
+
+  @classmethod
+  def refresh(cls, *args):
+    HwTopology.swap(cls.reprobe())
+
+  @classmethod
+  def get_caps(cls):
+    topo = HwTopology.get()
+    return {key: topo.caps.get(key) for key in cls.PROBES.keys()}
+
+  @classmethod
+  def get_sysinfo(cls):
+    topo = HwTopology.get()
+    info = {}
+    info["version"] = __version__
+    info["cpu"] = {"model": topo.model, "sockets": topo.sockets, "cores": topo.cores, "threads": topo.threads}
+    info["caps"] = cls.get_caps()
+    info["source"] = dict(cls.STATUS)
+    return info
@@ -1,6 +1,7 @@
 import os.path
 
 from ecofreq.utils import read_value,write_value
+from ecofreq.helpers.topology import HwTopology
 
 class SuspendHelper(object):
   SYS_PWR="/sys/power/"
@@ -13,6 +14,10 @@ class SuspendHelper(object):
 
   @classmethod
   def available(cls):
+    return HwTopology.get().cached("suspend", cls.probe)
+
+  @classmethod
+  def probe(cls):
     return os.path.isdir(cls.SYS_PWR)
 
   @classmethod
@@ -0,0 +1,150 @@
+import os
+import time
+import errno
+from array import array
+
+class SysfsWriter(object):
+  # open writers, shared by all helpers (fname -> SysfsWriter)
+  WRITERS = {}
+  # errors after which the file is reopened, e.g. device was re-registered
+  REOPEN_ERRORS = [errno.ENODEV, errno.EBADF, errno.ENOENT]
+
+  def __init__(self, fname):
+    self.fname = fname
+    self.fd = None
+    self.last_val = None
+    self.writes = 0
+    self.skipped = 0
+    self.total_time = 0.
+    self.max_time = 0.
+
+  @classmethod
+  def get(cls, fname):
+    if fname not in cls.WRITERS:
+      cls.WRITERS[fname] = SysfsWriter(fname)
+    return cls.WRITERS[fname]
+
+  @classmethod
+  def write_value(cls, fname, val):
+    return cls.get(fname).write(val)
+
+  @classmethod
+  def invalidate_all(cls):
+    for w in cls.WRITERS.values():
+      w.invalidate()
+
+  @classmethod
+  def close_all(cls):
+    for w in cls.WRITERS.values():
+      w.close()
+    cls.WRITERS = {}
+
+  @classmethod
+  def get_stats(cls):
+    writes = sum([w.writes for w in cls.WRITERS.values()])
+    skipped = sum([w.skipped for w in cls.WRITERS.values()])
+    total_time = sum([w.total_time for w in cls.WRITERS.values()])
+    max_time = max([w.max_time for w in cls.WRITERS.values()], default=0.)
+    stats = {}
+    stats["files"] = len(cls.WRITERS)
+    stats["writes"] = writes
+    stats["skipped"] = skipped
+    stats["avg_latency_ms"] = 1e3 * total_time / writes if writes else None
+    stats["max_latency_ms"] = 1e3 * max_time
+    return stats
+
+  def open(self):
+    self.fd = os.open(self.fname, os.O_WRONLY)
+
+  def close(self):
+    if self.fd is not None:
+      try:
+        os.close(self.fd)
+      except OSError:
+        pass
+    self.fd = None
+
+  def invalidate(self):
+    # value might have been changed by someone else -> write next value unconditionally
+    self.last_val = None
+
+  def write(self, val, force=False):
+    s = str(val)
+    if s == self.last_val and not force:
+      self.skipped += 1
+      return True
+    t1 = time.perf_counter()
+    try:
+      if self.fd is None:
+        self.open()
+      try:
+        os.pwrite(self.fd, s.encode(), 0)
+      except OSError as e:
+        if e.errno not in self.REOPEN_ERRORS:
+          raise
+        self.close()
+        self.open()
+        os.pwrite(self.fd, s.encode(), 0)
+    except FileNotFoundError:
+      self.close()
+      return False
+    dt = time.perf_counter() - t1
+    self.writes += 1
+    self.total_time += dt
+    self.max_time = max(self.max_time, dt)
+    self.last_val = s
+    return True
+
+class SysfsReader(object):
+  BUF_SIZE=64
+  # errors after which the file is reopened, e.g. after CPU hotplug
+  REOPEN_ERRORS = [errno.ENODEV, errno.EBADF]
+
+  # set of sysfs attribute files which are opened once and re-read with pread on every sample
+  def __init__(self, fnames):
+    self.fnames = list(fnames)
+    self.fds = [None] * len(self.fnames)
+
+  def close(self):
+    for i in range(len(self.fds)):
+      self.close_fd(i)
+
+  def close_fd(self, i):
+    if self.fds[i] is not None:
+      try:
+        os.close(self.fds[i])
+      except OSError:
+        pass
+    self.fds[i] = None
+
+  def pread(self, i, size=BUF_SIZE, offset=0):
+    if self.fds[i] is None:
+      self.fds[i] = os.open(self.fnames[i], os.O_RDONLY)
+    return os.pread(self.fds[i], size, offset)
+
+  def read(self, i, size=BUF_SIZE, offset=0):
+    # try once more after reopening the file
+    for attempt in range(2):
+      try:
+        return self.pread(i, size, offset)
+      except FileNotFoundError:
+        break
+      except OSError as e:
+        self.close_fd(i)
+        if e.errno not in self.REOPEN_ERRORS:
+          raise
+    # file is gone, e.g. CPU is offline 
+    self.close_fd(i)
+    return None
+
+  def read_all(self):
+    # values of all files in the given order, None if not readable
+    vals = []
+    for i in range(len(self.fnames)):
+      s = self.read(i)
+      vals.append(int(s) if s else None)
+    return vals
+
+  def read_ints(self):
+    # values of all readable files
+    return array('q', [v for v in self.read_all() if v is not None])
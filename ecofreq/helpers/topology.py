@@ -0,0 +1,93 @@
+import os.path
+
+from ecofreq.helpers.sysfs import SysfsReader, SysfsWriter
+
+class HwTopology(object):
+  CPUINFO_FILE = "/proc/cpuinfo"
+  ONLINE_FILE = "/sys/devices/system/cpu/online"
+  # shared instance
+  TOPO = None
+  ONLINE_READER = None
+  # capabilities that do not depend on the set of online CPUs (e.g. external tools) -> kept on hotplug
+  STATIC_CAPS = set()
+
+  def __init__(self):
+    # lazily probed capabilities (e.g. RAPL domains, cpufreq driver, GPUs)
+    self.caps = {}
+    self.online = self.read_online()
+    self.parse_cpuinfo()
+
+  @classmethod
+  def get(cls):
+    if not cls.TOPO:
+      cls.TOPO = HwTopology()
+    return cls.TOPO
+
+  @classmethod
+  def refresh(cls, *args):
+    cls.swap(None)
+
+  @classmethod
+  def swap(cls, topo):
+    # replace shared instance (None = rebuild on next use); old readers are closed only afterwards
+    old_topo, cls.TOPO = cls.TOPO, topo
+    if old_topo:
+      old_topo.close()
+    # limits might have been reset by kernel/firmware (e.g. on hotplug) -> rewrite them on next update
+    SysfsWriter.invalidate_all()
+
+  @classmethod
+  def check_hotplug(cls):
+    # rebuild topology if the set of online CPUs has changed
+    if cls.TOPO and cls.read_online() != cls.TOPO.online:
+      old_topo = cls.TOPO
+      topo = HwTopology()
+      for key in cls.STATIC_CAPS & old_topo.caps.keys():
+        topo.caps[key] = old_topo.caps.pop(key)
+      cls.swap(topo)
+      return True
+    return False
+
+  @classmethod
+  def read_online(cls):
+    if not cls.ONLINE_READER:
+      cls.ONLINE_READER = SysfsReader([cls.ONLINE_FILE])
+    s = cls.ONLINE_READER.read(0)
+    return s.decode().strip() if s else None
+
+  def parse_cpuinfo(self):
+    self.threads = 0
+    self.model = None
+    cores = set()
+    sockets = set()
+    if os.path.isfile(self.CPUINFO_FILE):
+      with open(self.CPUINFO_FILE) as f:
+        pkg = core = None
+        for line in f:
+          k, _, v = line.partition(":")
+          k = k.strip()
+          v = v.strip()
+          if k == "processor":
+            self.threads += 1
+            pkg = core = None
+          elif k == "physical id":
+            pkg = v
+            sockets.add(pkg)
+          elif k == "core id":
+            core = v
+            cores.add((pkg, core))
+          elif k == "model name" and not self.model:
+            self.model = v
+    self.sockets = max(len(sockets), 1)
+    # no SMT information (e.g. some VMs and ARM) -> every thread is a core
+    self.cores = len(cores) if cores else self.threads
+
+  def close(self):
+    for c in self.caps.values():
+      if hasattr(c, "close"):
+        c.close()
+
+  def cached(self, key, func):
+    if key not in self.caps:
+      self.caps[key] = func()
+    return self.caps[key]
@@ -16,6 +16,14 @@ class Monitor(object):
     self.period_samples += 1
     self.total_samples += 1
     
+  # subclasses can override this to register event sources with the asyncio loop
+  def attach(self, loop):
+    pass
+
+  # subclasses must override this to release background resources (e.g. threads) on shutdown
+  def stop(self):
+    pass
+
   # subclasses must override this
   def get_stats(self):
     return {}
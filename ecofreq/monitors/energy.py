@@ -1,18 +1,36 @@
+import time
+from array import array
+
 from ecofreq.config import OPTION_DISABLED
 from ecofreq.helpers.cpu import CpuInfoHelper, CpuFreqHelper, LinuxPowercapHelper
 from ecofreq.helpers.amd import AMDRaplMsrHelper
 from ecofreq.helpers.nvidia import NvidiaGPUHelper
 from ecofreq.helpers.ipmi import IPMIHelper
+from ecofreq.helpers.sysfs import SysfsReader
 from ecofreq.monitors.common import Monitor
+from ecofreq.monitors.sampler import PowerSampler, PowerRingBuffer
 from ecofreq.mqtt import MQTTManager
 
 class EnergyMonitor(Monitor):
+  # monitor can provide instantaneous power readings for background sampling
+  POWER_SAMPLING = False
+  # True: samples are point readings (-> trapezoid rule), False: averages since previous sample 
+  POINT_SAMPLES = True
+  # sec, lower bound for SampleInterval, e.g. if every reading spawns an external tool
+  MIN_SAMPLE_INTERVAL = 0.
+  # sec, max time to wait for the sampler thread on shutdown
+  STOP_TIMEOUT = 5
+
   def __init__(self, config):
     Monitor.__init__(self, config)
     self.total_energy = 0
     self.period_energy = 0
     self.last_avg_power = 0
     self.monitor_freq = CpuFreqHelper.available()
+    self.sampler = None
+    self.buffer = None
+    self.last_sample = None
+    self.period_power = array('d')
 
   @classmethod
   def from_config(cls, config):
@@ -39,10 +57,49 @@ class EnergyMonitor(Monitor):
           monitors.append(sens_dict[s](config))  
         else:
           raise ValueError("Unknown power sensor: " + p)
+    # optional sub-second power sampling in background thread
+    sample_interval = float(config["monitor"].get("SampleInterval", 0))
+    if sample_interval > 0:
+      buf_size = int(config["monitor"].get("SampleBuffer", 4096))
+      for m in monitors:
+        m.init_sampler(sample_interval, buf_size)
     return monitors
 
+  def init_sampler(self, interval, buf_size):
+    if not self.POWER_SAMPLING:
+      return
+    if interval < self.MIN_SAMPLE_INTERVAL:
+      print("WARNING: SampleInterval too short for " + type(self).__name__ + ", using", self.MIN_SAMPLE_INTERVAL, "sec")
+      interval = self.MIN_SAMPLE_INTERVAL
+    if buf_size * interval < 2 * self.interval:
+      raise ValueError("SampleBuffer too small for monitor interval: " + str(buf_size))
+    self.sampler = PowerSampler(self.read_power, interval, buf_size)
+    self.buffer = self.sampler.buffer
+    self.sampler.start()
+
+  def stop(self):
+    if self.sampler:
+      self.sampler.stop(self.STOP_TIMEOUT)
+
+  # instantaneous power in W (or None) -> must be overridden if POWER_SAMPLING = True
+  def read_power(self):
+    return None
+
+  def sampled_energy(self):
+    # integrate power samples collected since last call
+    energy = 0.
+    last = self.last_sample
+    for ts, pwr in self.buffer.read_new():
+      if last:
+        avg_pwr = 0.5 * (last[1] + pwr) if self.POINT_SAMPLES else pwr
+        energy += avg_pwr * (ts - last[0])
+      self.period_power.append(pwr)
+      last = (ts, pwr)
+    self.last_sample = last
+    return energy
+
   def update_energy(self):
-    energy = self.sample_energy()
+    energy = self.sampled_energy() if self.buffer else self.sample_energy()
 #    print("energy diff:", energy)
     self.last_avg_power = energy / self.interval
     self.total_energy += energy
@@ -75,6 +132,18 @@ class EnergyMonitor(Monitor):
   def reset_period(self):
     Monitor.reset_period(self)
     self.period_energy = 0
+    self.period_power = array('d')
+
+  def get_period_power_stats(self):
+    if not self.buffer:
+      return None
+    vals = sorted(self.period_power)
+    pct = lambda q: vals[min(int(q / 100. * len(vals)), len(vals) - 1)] if vals else None
+    return {"samples": len(vals),
+            "peak": vals[-1] if vals else None,
+            "p50": pct(50),
+            "p95": pct(95),
+            "dropped": self.buffer.dropped }
 
 class NoEnergyMonitor(EnergyMonitor):
   def update_energy(self):
@@ -82,9 +151,12 @@ class NoEnergyMonitor(EnergyMonitor):
   
 class RAPLEnergyMonitor(EnergyMonitor):
   UJOULE, JOULE, WH = 1, 1e6, 3600*1e6
+  POWER_SAMPLING = True
+  POINT_SAMPLES = False
   
   def __init__(self, config):
     EnergyMonitor.__init__(self, config)
+    self.last_power_ts = None
     c = config['powercap'] if 'powercap' in config else {}
     self.estimate_full_power = c.get('EstimateFullPower', True)
     self.syspower_coeff_const = c.get('FullPowerConstCoeff', 0.3)
@@ -101,27 +173,51 @@ class RAPLEnergyMonitor(EnergyMonitor):
       self.energy_range[p] = self.get_package_energy_range(p)
     self.sample_energy()
     
-  def full_system_energy(self, energy_diff):
+  def full_system_energy(self, energy_diff, interval=None):
     if self.psys_domain or not self.estimate_full_power:
       return energy_diff
     else:
-      sysenergy_const = self.cpu_max_power_uw * self.syspower_coeff_const * self.interval
+      sysenergy_const = self.cpu_max_power_uw * self.syspower_coeff_const * (interval or self.interval)
       sysenegy_var = (1. + self.syspower_coeff_var) * energy_diff
       return sysenergy_const + sysenegy_var 
 
-  def sample_energy(self):
+  def read_energy(self):
+    return [self.get_package_energy(p) for p in self.pkg_list]
+
+  def package_energy_diff(self):
     energy_diff = 0
-    for p in self.pkg_list:
-      new_energy = self.get_package_energy(p)
+    for p, new_energy in zip(self.pkg_list, self.read_energy()):
+      if new_energy is None:
+        continue
       if new_energy >= self.last_energy[p]:
         diff_uj = new_energy - self.last_energy[p]
       else:
         diff_uj = new_energy + (self.energy_range[p] - self.last_energy[p]);
       self.last_energy[p] = new_energy
       energy_diff += diff_uj
-    energy_diff = self.full_system_energy(energy_diff)
+    return energy_diff
+
+  def sample_energy(self):
+    energy_diff = self.full_system_energy(self.package_energy_diff())
     energy_diff_j = energy_diff / self.JOULE  
     return energy_diff_j
+
+  def init_sampler(self, interval, buf_size):
+    # baseline for the first reading, which then covers the time since sampler start
+    self.package_energy_diff()
+    self.last_power_ts = time.monotonic()
+    self.last_sample = (self.last_power_ts, 0.)
+    EnergyMonitor.init_sampler(self, interval, buf_size)
+
+  def read_power(self):
+    # average power since previous reading; frequent readings also avoid missing counter wraparounds
+    ts = time.monotonic()
+    energy_diff = self.package_energy_diff()
+    last_ts, self.last_power_ts = self.last_power_ts, ts
+    if last_ts is None or ts <= last_ts:
+      return None
+    dt = ts - last_ts
+    return self.full_system_energy(energy_diff, dt) / self.JOULE / dt
   
 class PowercapEnergyMonitor(RAPLEnergyMonitor):
 
@@ -149,6 +245,13 @@ class PowercapEnergyMonitor(RAPLEnergyMonitor):
         else:
           self.cpu_max_power_uw = CpuInfoHelper.get_tdp_uw()
       self.pkg_list += LinuxPowercapHelper.package_list("dram")
+    self.init_reader()
+
+  def init_reader(self):
+    self.reader = SysfsReader([LinuxPowercapHelper.package_file(p, "energy_uj") for p in self.pkg_list])
+
+  def read_energy(self):
+    return self.reader.read_all()
   
   def get_package_energy(self, pkg):
     return LinuxPowercapHelper.get_package_energy(pkg)
@@ -161,8 +264,8 @@ class AMDMsrEnergyMonitor(RAPLEnergyMonitor):
   @classmethod
   def available(cls):
     try:
-      energy = AMDRaplMsrHelper.get_package_energy(0)
-      return energy > 0
+      energy = AMDRaplMsrHelper.package_reader().read_energy()
+      return len(energy) > 0 and (energy[0] or 0) > 0
     except OSError:
       return False
 
@@ -172,6 +275,10 @@ class AMDMsrEnergyMonitor(RAPLEnergyMonitor):
   def init_pkg_list(self):
     self.pkg_list = AMDRaplMsrHelper.package_list()
     self.cpu_max_power_uw = CpuInfoHelper.get_tdp_uw()
+    self.reader = AMDRaplMsrHelper.package_reader()
+
+  def read_energy(self):
+    return self.reader.read_energy()
 
   def get_package_energy(self, pkg):
     return AMDRaplMsrHelper.get_package_energy(pkg)
@@ -179,8 +286,92 @@ class AMDMsrEnergyMonitor(RAPLEnergyMonitor):
   def get_package_energy_range(self, pkg):
     return AMDRaplMsrHelper.get_package_energy_range(pkg)
 
+class AMDCoreEnergyMonitor(Monitor):
+  # Per-core energy from AMD core energy MSRs. Core energy is already included in the package domain,
+  # so this is not an EnergyMonitor and does not contribute to system energy/power.
+  def __init__(self, config):
+    Monitor.__init__(self, config)
+    self.cpus = AMDRaplMsrHelper.core_list()
+    self.reader = AMDRaplMsrHelper.core_reader()
+    n = len(self.cpus)
+    self.total_energy = array('d', [0.] * n)
+    self.period_energy = array('d', [0.] * n)
+    self.last_power = array('d', [0.] * n)
+    self.last_energy = self.reader.read_energy()
+
+  @classmethod
+  def available(cls):
+    try:
+      energy = AMDRaplMsrHelper.core_reader().read_energy()
+      return len(energy) > 0 and energy[0] is not None
+    except OSError:
+      return False
+
+  @classmethod
+  def from_config(cls, config):
+    p = config["monitor"].get("CoreSensor", "off").lower()
+    monitors = []
+    if p in OPTION_DISABLED:
+      pass
+    elif p == "auto":
+      if cls.available():
+        monitors.append(cls(config))
+    elif p == "amd_msr":
+      monitors.append(cls(config))
+    else:
+      raise ValueError("Unknown core power sensor: " + p)
+    return monitors
+
+  def update_impl(self):
+    new_energy = self.reader.read_energy()
+    for i, e in enumerate(new_energy):
+      last = self.last_energy[i]
+      self.last_energy[i] = e
+      if e is None or last is None:
+        # core went offline or came back
+        self.last_power[i] = 0.
+        continue
+      if e >= last:
+        diff_uj = e - last
+      else:
+        diff_uj = e + (self.reader.energy_range[i] - last)
+      diff_j = diff_uj / RAPLEnergyMonitor.JOULE
+      self.total_energy[i] += diff_j
+      self.period_energy[i] += diff_j
+      self.last_power[i] = diff_j / self.interval
+
+  def reset_period(self):
+    Monitor.reset_period(self)
+    for i in range(len(self.period_energy)):
+      self.period_energy[i] = 0.
+
+  def get_core_energy(self):
+    # cpu -> total energy (J) since start
+    return dict(zip(self.cpus, self.total_energy))
+
+  def get_period_core_power(self):
+    # cpu -> avg power (W) in current period
+    t = self.period_samples * self.interval
+    return {cpu: (e / t if t else 0.) for cpu, e in zip(self.cpus, self.period_energy)}
+
+  def get_hot_core(self):
+    if not self.cpus:
+      return None, None
+    i = max(range(len(self.cpus)), key=self.last_power.__getitem__)
+    return self.cpus[i], self.last_power[i]
+
+  def get_stats(self):
+    hot_core, hot_power = self.get_hot_core()
+    return {"HotCore": hot_core,
+            "HotCorePower": hot_power,
+            "CoresPower": sum(self.last_power)}
+
 
 class GPUEnergyMonitor(EnergyMonitor):
+  POWER_SAMPLING = True
+  # every reading runs nvidia-smi
+  MIN_SAMPLE_INTERVAL = 1.
+
   def __init__(self, config):
     EnergyMonitor.__init__(self, config)
     self.last_pwr = 0
@@ -189,6 +380,9 @@ class GPUEnergyMonitor(EnergyMonitor):
   def available(cls):
     return NvidiaGPUHelper.available()
 
+  def read_power(self):
+    return NvidiaGPUHelper.get_power() or None
+
   def sample_energy(self):
     cur_pwr = NvidiaGPUHelper.get_power()
     if not cur_pwr:
@@ -200,6 +394,10 @@ class GPUEnergyMonitor(EnergyMonitor):
     return energy_diff
 
 class IPMIEnergyMonitor(EnergyMonitor):
+  POWER_SAMPLING = True
+  # every reading runs ipmitool, BMC may take seconds to respond
+  MIN_SAMPLE_INTERVAL = 5.
+
   def __init__(self, config):
     EnergyMonitor.__init__(self, config)
     self.last_pwr = 0
@@ -208,6 +406,9 @@ class IPMIEnergyMonitor(EnergyMonitor):
   def available(cls):
     return IPMIHelper.available()
 
+  def read_power(self):
+    return IPMIHelper.get_power() or None
+
   def sample_energy(self):
     cur_pwr = IPMIHelper.get_power()
     if not cur_pwr:
@@ -231,6 +432,17 @@ class MQTTEnergyMonitor(EnergyMonitor):
   def available(cls):
     return True
 
+  def init_sampler(self, interval, buf_size):
+    # readings are pushed by the broker -> no sampler thread, received values go to the buffer directly
+    self.buffer = PowerRingBuffer(buf_size)
+    self.mqtt_client.on_msg = self.on_power_msg
+
+  def on_power_msg(self, payload):
+    try:
+      self.buffer.append(time.monotonic(), float(payload))
+    except ValueError:
+      print ("WARNING: Invalid MQTT power reading:", payload)
+
   def sample_energy(self):
     cur_pwr = self.mqtt_client.get_msg()
     if not cur_pwr:
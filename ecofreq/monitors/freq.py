@@ -1,5 +1,9 @@
+import time
+
 from ecofreq.monitors.common import Monitor
-from ecofreq.helpers.cpu import CpuFreqHelper
+from ecofreq.helpers.cpu import CpuFreqHelper, CpuInfoHelper
+from ecofreq.helpers.msr import MsrReader
+from ecofreq.helpers.topology import HwTopology
 from ecofreq.config import OPTION_DISABLED
 
 class FreqMonitor(Monitor):
@@ -15,13 +19,16 @@ class FreqMonitor(Monitor):
 
   @classmethod
   def from_config(cls, config):
-    sens_dict = { "cpu" : CPUFreqMonitor }
+    sens_dict = { "cpu" : CPUFreqMonitor, "msr" : MsrFreqMonitor }
     p = config["monitor"].get("FreqSensor", "auto").lower()
     monitors = []
     if p in OPTION_DISABLED:
       pass
     elif p == "auto":
-      if CPUFreqMonitor.available():
+      # prefer delivered frequency over requested one
+      if MsrFreqMonitor.available():
+        monitors.append(MsrFreqMonitor(config))
+      elif CPUFreqMonitor.available():
         monitors.append(CPUFreqMonitor(config))
     else:
       for s in p.split(","):
@@ -39,8 +46,13 @@ class CPUFreqMonitor(FreqMonitor):
   def available(cls):
     return CpuFreqHelper.available()
   
+  def sample_freq(self):
+    return CpuFreqHelper.get_avg_gov_cur_freq()
+
   def update_freq(self):
-    avg_freq = CpuFreqHelper.get_avg_gov_cur_freq()
+    avg_freq = self.sample_freq()
+    if avg_freq is None:
+      return
     frac_new = 1. / (self.period_samples + 1)
     frac_old = self.period_samples * frac_new
     self.period_freq = frac_old * self.period_freq + frac_new * avg_freq
@@ -54,3 +66,72 @@ class CPUFreqMonitor(FreqMonitor):
      
   def get_last_avg_freq(self, unit=CpuFreqHelper.KHZ):
     return self.last_freq / unit
+
+class MsrFreqMonitor(CPUFreqMonitor):
+  # delivered (effective) frequency from APERF/MPERF counters
+  MSR_TSC = 0x10
+  MSR_MPERF = 0xE7
+  MSR_APERF = 0xE8
+  MSR_CPU_PATH = MsrReader.MSR_CPU_PATH
+  MSR_STRIDE = 1
+
+  def __init__(self, config):
+    CPUFreqMonitor.__init__(self, config)
+    self.last_busy = 0.
+    self.init_reader()
+
+  def init_reader(self):
+    # reader is owned by topology -> rebuilt (for the new set of CPUs) after hotplug
+    self.reader = HwTopology.get().cached("msr_freq_reader", 
+                                          lambda: MsrReader(sorted(CpuInfoHelper.get_cpu_packages().keys()), self.MSR_CPU_PATH, self.MSR_STRIDE))
+    self.cpus = self.reader.cpus
+    self.last_counters = self.read_counters()
+
+  @classmethod
+  def available(cls):
+    try:
+      reader = MsrReader([0], cls.MSR_CPU_PATH, cls.MSR_STRIDE)
+      aperf = reader.read_msr(0, cls.MSR_APERF)
+      reader.close()
+      return aperf is not None
+    except OSError:
+      return False
+
+  def read_counters(self):
+    # all CPUs, one register at a time: TSC, MPERF, APERF (None if CPU is offline)
+    ts = time.monotonic()
+    return [ts] + [self.reader.read_msr_all(reg) for reg in [self.MSR_TSC, self.MSR_MPERF, self.MSR_APERF]]
+
+  def sample_freq(self):
+    if HwTopology.get().caps.get("msr_freq_reader") is not self.reader:
+      # CPU hotplug -> new baseline
+      self.init_reader()
+      return None
+    counters = self.read_counters()
+    ts, tsc, mperf, aperf = counters
+    last_ts, last_tsc, last_mperf, last_aperf = self.last_counters
+    self.last_counters = counters
+    sum_tsc = sum_mperf = sum_aperf = 0
+    ncpus = 0
+    for i in range(len(self.cpus)):
+      if None in (tsc[i], mperf[i], aperf[i], last_tsc[i], last_mperf[i], last_aperf[i]):
+        continue
+      d_tsc = tsc[i] - last_tsc[i]
+      d_mperf = mperf[i] - last_mperf[i]
+      d_aperf = aperf[i] - last_aperf[i]
+      # counter reset, e.g. after suspend
+      if d_tsc <= 0 or d_mperf < 0 or d_aperf < 0:
+        continue
+      sum_tsc += d_tsc
+      sum_mperf += d_mperf
+      sum_aperf += d_aperf
+      ncpus += 1
+    if not ncpus or ts <= last_ts:
+      return None
+    # TSC ticks at nominal frequency; MPERF only ticks in C0 -> APERF/MPERF sums are busy-weighted across CPUs
+    nominal_khz = sum_tsc / ncpus / (ts - last_ts) / 1e3
+    self.last_busy = sum_mperf / sum_tsc
+    return nominal_khz * sum_aperf / sum_mperf if sum_mperf else 0.
+
+  def get_stats(self):
+    return {"BusyPct": 100. * self.last_busy}
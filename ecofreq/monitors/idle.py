@@ -1,3 +1,5 @@
+import os
+import struct
 from subprocess import check_output,DEVNULL
 
 from ecofreq.utils import *
@@ -6,6 +8,10 @@ from ecofreq.config import OPTION_DISABLED
 
 class IdleMonitor(Monitor):
   CMD_SESSION_COUNT="w -h | wc -l"
+  UTMP_FILE="/var/run/utmp"
+  # struct utmp (glibc, Linux): ut_type, ut_pid, ut_line, ut_id, ut_user, ut_host, ut_exit, ut_session, ut_tv, ut_addr_v6
+  UTMP_STRUCT=struct.Struct("=hxxi32s4s32s256shhiii4i20x")
+  UTMP_USER_PROCESS=7
   LOADAVG_FILE="/proc/loadavg"
   LOADAVG_M1=1
   LOADAVG_M5=2
@@ -28,22 +34,51 @@ class IdleMonitor(Monitor):
     self.load_period = int(c.get('LoadPeriod', 1))
     if self.load_period not in [self.LOADAVG_M1, self.LOADAVG_M5, self.LOADAVG_M15]:
       raise ValueError("IdleMonitor: Unknown load period: " + self.load_period)
+    self.utmp_stamp = None
+    self.utmp_sessions = 0
     self.reset()
 
   def reset_period(self):
     Monitor.reset_period(self)
     self.max_sessions = 0
     self.max_load = 0.
+    self.period_pressure = False
 
   def reset(self):
     self.idle_duration = 0
     self.last_sessions = 0
     self.last_load = 0.
+    # pressure trigger fired in current/previous sampling interval
+    self.last_pressure = self.next_pressure = False
     self.reset_period()
 
   def active_sessions(self):
-    out = check_output(self.CMD_SESSION_COUNT, shell=True, stderr=DEVNULL, universal_newlines=True)
-    return int(out)    
+    try:
+      st = os.stat(self.UTMP_FILE)
+    except OSError:
+      # no utmp -> let w figure it out
+      out = check_output(self.CMD_SESSION_COUNT, shell=True, stderr=DEVNULL, universal_newlines=True)
+      return int(out)    
+    # re-parse only if utmp has changed
+    stamp = (st.st_ino, st.st_size, st.st_mtime_ns)
+    if stamp != self.utmp_stamp:
+      self.utmp_sessions = self.count_utmp_sessions(self.UTMP_FILE)
+      self.utmp_stamp = stamp
+    return self.utmp_sessions
+
+  @classmethod
+  def count_utmp_sessions(cls, fname):
+    # same as w: count USER_PROCESS entries with a user name
+    with open(fname, "rb") as f:
+      data = f.read()
+    count = 0
+    rec_size = cls.UTMP_STRUCT.size
+    for off in range(0, len(data) - rec_size + 1, rec_size):
+      rec = cls.UTMP_STRUCT.unpack_from(data, off)
+      ut_type, ut_user = rec[0], rec[4]
+      if ut_type == cls.UTMP_USER_PROCESS and ut_user.rstrip(b"\0"):
+        count += 1
+    return count
 
   def active_load(self):
     return float(read_value(self.LOADAVG_FILE, self.load_period))
@@ -53,26 +88,34 @@ class IdleMonitor(Monitor):
     self.last_load = self.active_load()
     self.max_sessions = max(self.max_sessions, self.last_sessions)
     self.max_load = max(self.max_load, self.last_load)
+    self.last_pressure, self.next_pressure = self.next_pressure, False
     if self.get_period_idle() == "IDLE":
       self.idle_duration += self.interval
     else:
       self.idle_duration = 0
     
-  def get_state(self, sessions, load):
-    if sessions > 0 and load > self.load_cutoff:
+  def on_pressure(self, resource):
+    # PSI trigger fired -> system is busy, no need to wait for loadavg to catch up
+    self.period_pressure = True
+    self.last_pressure = self.next_pressure = True
+    self.idle_duration = 0
+
+  def get_state(self, sessions, load, pressure=False):
+    busy = load > self.load_cutoff or pressure
+    if sessions > 0 and busy:
       return "ACTIVE"
     elif sessions > 0:
       return "SESSION"
-    elif load > self.load_cutoff:
+    elif busy:
       return "LOAD"
     else:
       return "IDLE"
 
   def get_period_idle(self):
-    return self.get_state(self.max_sessions, self.max_load)
+    return self.get_state(self.max_sessions, self.max_load, self.period_pressure)
 
   def get_last_idle(self):
-    return self.get_state(self.last_sessions, self.last_load)
+    return self.get_state(self.last_sessions, self.last_load, self.last_pressure)
     
   def get_stats(self):
     return {"State": self.get_period_idle(),
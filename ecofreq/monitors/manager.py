@@ -1,15 +1,24 @@
 from math import ceil
 
-from ecofreq.monitors.energy import EnergyMonitor
+from ecofreq.monitors.energy import EnergyMonitor, AMDCoreEnergyMonitor
 from ecofreq.monitors.freq import FreqMonitor, CPUFreqMonitor
 from ecofreq.monitors.idle import IdleMonitor
+from ecofreq.monitors.pressure import PressureMonitor
+from ecofreq.monitors.util import UtilMonitor
 from ecofreq.helpers import CpuFreqHelper
 
 class MonitorManager(object):
   def __init__(self, config):
     self.monitors = EnergyMonitor.from_config(config)
     self.monitors += FreqMonitor.from_config(config)
+    self.monitors += AMDCoreEnergyMonitor.from_config(config)
     self.monitors += IdleMonitor.from_config(config)
+    self.monitors += PressureMonitor.from_config(config)
+    self.monitors += UtilMonitor.from_config(config)
+    psimon = self.get_by_class(PressureMonitor)
+    idlemon = self.get_by_class(IdleMonitor)
+    if psimon and idlemon:
+      psimon.add_listener(idlemon.on_pressure)
     
   def info_string(self):
     s = []
@@ -26,6 +35,14 @@ class MonitorManager(object):
         m.interval = sample_interval * int(m.interval / sample_interval)
     return sample_interval
 
+  def attach(self, loop):
+    for m in self.monitors:
+      m.attach(loop)
+
+  def stop(self):
+    for m in self.monitors:
+      m.stop()
+
   def update(self, duration):
     for m in self.monitors:
       if duration % m.interval == 0:
@@ -67,6 +84,15 @@ class MonitorManager(object):
         result += m.get_last_avg_power()
     return result
 
+  def get_period_power_stats(self):
+    result = {}
+    for m in self.monitors:
+      if issubclass(type(m), EnergyMonitor):
+        s = m.get_period_power_stats()
+        if s:
+          result[type(m).__name__] = s
+    return result
+
   def get_last_cpu_avg_freq(self, unit=CpuFreqHelper.MHZ):
     for m in self.monitors:
       if issubclass(type(m), CPUFreqMonitor):
@@ -85,6 +111,18 @@ class MonitorManager(object):
         return m.get_period_idle()
     return None
   
+  def get_period_util(self):
+    for m in self.monitors:
+      if issubclass(type(m), UtilMonitor):
+        return m.get_period_util()
+    return None
+
+  def get_last_util(self):
+    for m in self.monitors:
+      if issubclass(type(m), UtilMonitor):
+        return m.get_last_util()
+    return None
+
   def get_by_class(self, cls):
     for m in self.monitors:
       if issubclass(type(m), cls):
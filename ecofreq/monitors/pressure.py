@@ -0,0 +1,133 @@
+import os
+import errno
+import select
+
+from ecofreq.monitors.common import Monitor
+from ecofreq.helpers.sysfs import SysfsReader
+from ecofreq.config import OPTION_DISABLED
+
+class PressureMonitor(Monitor):
+  PSI_PATH="/proc/pressure/{0}"
+  RESOURCES=["cpu", "memory", "io"]
+  BUF_SIZE=256
+  # ms, unprivileged users may only register triggers with window being a multiple of 2s
+  UNPRIV_WINDOW=2000
+
+  @classmethod
+  def available(cls):
+    return os.path.isfile(cls.PSI_PATH.format("cpu"))
+
+  @classmethod
+  def from_config(cls, config):
+    p = config["monitor"].get("PressureSensor", "auto").lower()
+    monitors = []
+    if p in OPTION_DISABLED:
+      pass
+    elif p == "auto":
+      if cls.available():
+        monitors.append(PressureMonitor(config))
+    elif p in ["psi", "on"]:
+      monitors.append(PressureMonitor(config))
+    else:
+      raise ValueError("Unknown pressure sensor: " + p)
+    return monitors
+
+  def __init__(self, config):
+    Monitor.__init__(self, config)
+    c = config["monitor"]
+    self.resources = [r.strip() for r in c.get("PressureResources", ",".join(self.RESOURCES)).split(",")]
+    for r in self.resources:
+      if r not in self.RESOURCES:
+        raise ValueError("PressureMonitor: Unknown resource: " + r)
+    # trigger fires if tasks were stalled for PressureStall ms within PressureWindow ms
+    self.trigger_stall = int(c.get("PressureStall", 100))
+    self.trigger_window = int(c.get("PressureWindow", self.UNPRIV_WINDOW))
+    self.reader = SysfsReader([self.PSI_PATH.format(r) for r in self.resources])
+    self.listeners = []
+    self.epoll = None
+    self.trigger_fds = {}
+    self.events = {r: 0 for r in self.resources}
+    self.last_pressure = {r: 0. for r in self.resources}
+    self.reset_period()
+    self.init_triggers()
+
+  def reset_period(self):
+    Monitor.reset_period(self)
+    self.max_pressure = {r: 0. for r in self.resources}
+
+  @classmethod
+  def trigger_str(cls, stall, window):
+    return "some {0} {1}".format(stall * 1000, window * 1000).encode() + b"\0"
+
+  def write_trigger(self, fd):
+    try:
+      os.write(fd, self.trigger_str(self.trigger_stall, self.trigger_window))
+    except OSError as e:
+      if e.errno != errno.EINVAL or self.trigger_window % self.UNPRIV_WINDOW == 0:
+        raise
+      # not privileged -> round window up to the next allowed value, and keep stall/window ratio
+      window = -(-self.trigger_window // self.UNPRIV_WINDOW) * self.UNPRIV_WINDOW
+      stall = self.trigger_stall * window // self.trigger_window
+      os.write(fd, self.trigger_str(stall, window))
+      self.trigger_stall, self.trigger_window = stall, window
+
+  def init_triggers(self):
+    # PSI triggers need write access
+    ep = select.epoll()
+    for r in self.resources:
+      fd = None
+      try:
+        fd = os.open(self.PSI_PATH.format(r), os.O_RDWR | os.O_NONBLOCK)
+        self.write_trigger(fd)
+        ep.register(fd, select.EPOLLPRI | select.EPOLLET)
+        self.trigger_fds[fd] = r
+      except OSError:
+        if fd is not None:
+          os.close(fd)
+    if self.trigger_fds:
+      self.epoll = ep
+    else:
+      ep.close()
+
+  def attach(self, loop):
+    # epoll fd becomes readable as soon as any of the triggers fires
+    if self.epoll:
+      loop.add_reader(self.epoll.fileno(), self.on_trigger)
+
+  def add_listener(self, func):
+    self.listeners.append(func)
+
+  def on_trigger(self):
+    for fd, ev in self.epoll.poll(0):
+      r = self.trigger_fds[fd]
+      if ev & select.EPOLLERR:
+        # trigger is gone for good
+        self.epoll.unregister(fd)
+        os.close(fd)
+        del self.trigger_fds[fd]
+        continue
+      self.events[r] += 1
+      for func in self.listeners:
+        func(r)
+
+  @classmethod
+  def parse_pressure(cls, s):
+    # "some avg10=1.55 avg60=1.32 avg300=1.31 total=23020598" -> avg10
+    for line in s.decode().split("\n"):
+      toks = line.split()
+      if toks and toks[0] == "some":
+        return float(toks[1].split("=")[1])
+    return None
+
+  def update_impl(self):
+    for i, r in enumerate(self.resources):
+      s = self.reader.read(i, self.BUF_SIZE)
+      val = self.parse_pressure(s) if s else None
+      if val is not None:
+        self.last_pressure[r] = val
+        self.max_pressure[r] = max(self.max_pressure[r], val)
+
+  def get_stats(self):
+    return {"Pressure": dict(self.last_pressure),
+            "MaxPressure": dict(self.max_pressure),
+            "PressureEvents": sum(self.events.values()) }
@@ -0,0 +1,57 @@
+import time
+import threading
+from array import array
+
+class PowerRingBuffer(object):
+  # preallocated buffer of (timestamp, power) samples, one writer (sampler thread) and one reader (main loop)
+  def __init__(self, size):
+    self.size = size
+    self.ts = array('d', [0.]) * size
+    self.power = array('d', [0.]) * size
+    # total number of samples written/consumed so far
+    self.count = 0
+    self.read_count = 0
+    self.dropped = 0
+
+  def append(self, ts, power):
+    i = self.count % self.size
+    self.ts[i] = ts
+    self.power[i] = power
+    # publish sample only after it has been written
+    self.count += 1
+
+  def read_new(self):
+    count = self.count
+    start = max(self.read_count, count - self.size)
+    # reader was too slow -> oldest samples have been overwritten
+    self.dropped += start - self.read_count
+    self.read_count = count
+    return [(self.ts[i % self.size], self.power[i % self.size]) for i in range(start, count)]
+
+class PowerSampler(threading.Thread):
+  def __init__(self, read_func, interval, size):
+    threading.Thread.__init__(self, daemon=True)
+    self.read_func = read_func
+    self.interval = interval
+    self.buffer = PowerRingBuffer(size)
+    self.stop_event = threading.Event()
+    self.errors = 0
+
+  def run(self):
+    # first reading after one interval: sensors reporting average power since previous reading need a baseline
+    next_ts = time.monotonic() + self.interval
+    while not self.stop_event.wait(max(next_ts - time.monotonic(), 0.)):
+      try:
+        pwr = self.read_func()
+      except Exception:
+        pwr = None
+        self.errors += 1
+      if pwr is not None:
+        self.buffer.append(time.monotonic(), pwr)
+      # slow sensor (e.g. IPMI) -> do not try to catch up
+      next_ts = max(next_ts + self.interval, time.monotonic())
+
+  def stop(self, timeout=None):
+    self.stop_event.set()
+    # wait for pending reading (e.g. external tool) to complete
+    self.join(timeout)
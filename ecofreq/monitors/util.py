@@ -0,0 +1,132 @@
+import os
+from array import array
+
+from ecofreq.monitors.common import Monitor
+from ecofreq.helpers.cpu import CpuInfoHelper
+from ecofreq.config import OPTION_DISABLED
+
+class UtilMonitor(Monitor):
+  STAT_FILE="/proc/stat"
+  # user nice system idle iowait irq softirq steal (guest time is already accounted in user)
+  NUM_FIELDS=8
+  IDLE_FIELD=3
+  IOWAIT_FIELD=4
+  BUF_SIZE=65536
+
+  @classmethod
+  def available(cls):
+    return os.path.isfile(cls.STAT_FILE)
+
+  @classmethod
+  def from_config(cls, config):
+    p = config["monitor"].get("UtilSensor", "auto").lower()
+    monitors = []
+    if p in OPTION_DISABLED:
+      pass
+    elif p in ["auto", "on", "procstat"]:
+      if cls.available():
+        monitors.append(UtilMonitor(config))
+    else:
+      raise ValueError("Unknown utilization sensor: " + p)
+    return monitors
+
+  def __init__(self, config):
+    Monitor.__init__(self, config)
+    self.fd = None
+    self.cpus = None
+    self.last_busy = None
+    self.last_total = None
+    self.cpu_util = []
+    self.pkg_util = {}
+    self.last_util = None
+    self.reset_period()
+    # initial counter values
+    self.update_util()
+
+  def reset_period(self):
+    Monitor.reset_period(self)
+    self.period_busy = 0
+    self.period_total = 0
+    self.max_cpu_util = 0.
+
+  def read_stat(self):
+    if self.fd is None:
+      self.fd = os.open(self.STAT_FILE, os.O_RDONLY)
+    size = self.BUF_SIZE
+    while True:
+      data = os.pread(self.fd, size, 0)
+      # per-CPU lines come first, so we can stop reading there
+      if len(data) < size or b"\nintr" in data:
+        return data
+      size *= 2
+
+  def parse_stat(self, data):
+    # -> list of CPU ids, flat list of NUM_FIELDS jiffy counters per CPU
+    cpus = []
+    vals = []
+    for line in data.split(b"\n"):
+      if not line.startswith(b"cpu"):
+        break
+      toks = line.split()
+      if toks[0] == b"cpu":
+        continue
+      cpus.append(int(toks[0][3:]))
+      vals += toks[1:self.NUM_FIELDS+1]
+    return cpus, vals
+
+  def busy_total(self, vals):
+    n = self.NUM_FIELDS
+    m = array('q', map(int, vals))
+    total = array('q', [sum(m[i:i+n]) for i in range(0, len(m), n)])
+    busy = array('q', [t - m[i*n+self.IDLE_FIELD] - m[i*n+self.IOWAIT_FIELD] for i, t in enumerate(total)])
+    return busy, total
+
+  def compute_util(self, d_busy, d_total):
+    pkgs = self.pkg_index
+    cpu_util = [100. * b / t if t > 0 else 0. for b, t in zip(d_busy, d_total)]
+    pkg_busy = [0] * (max(pkgs, default=-1) + 1)
+    pkg_total = list(pkg_busy)
+    for p, b, t in zip(pkgs, d_busy, d_total):
+      pkg_busy[p] += b
+      pkg_total[p] += t
+    busy_sum, total_sum = sum(d_busy), sum(d_total)
+    pkg_util = {pkg: 100. * b / t for pkg, (b, t) in enumerate(zip(pkg_busy, pkg_total)) if t > 0}
+    return cpu_util, pkg_util, busy_sum, total_sum
+
+  def update_util(self):
+    cpus, vals = self.parse_stat(self.read_stat())
+    busy, total = self.busy_total(vals)
+    if cpus != self.cpus:
+      # first sample or CPU hotplug -> new baseline
+      self.cpus = cpus
+      pkg_map = CpuInfoHelper.get_cpu_packages()
+      self.pkg_index = [pkg_map.get(c, 0) for c in cpus]
+      self.last_busy, self.last_total = busy, total
+      return
+    d_busy = [b - lb for b, lb in zip(busy, self.last_busy)]
+    d_total = [t - lt for t, lt in zip(total, self.last_total)]
+    self.last_busy, self.last_total = busy, total
+    self.cpu_util, self.pkg_util, busy_sum, total_sum = self.compute_util(d_busy, d_total)
+    self.last_util = 100. * busy_sum / total_sum if total_sum > 0 else 0.
+    self.period_busy += busy_sum
+    self.period_total += total_sum
+    self.max_cpu_util = max(self.max_cpu_util, max(self.cpu_util, default=0.))
+
+  def update_impl(self):
+    self.update_util()
+
+  def get_last_util(self):
+    return self.last_util
+
+  def get_period_util(self):
+    return 100. * self.period_busy / self.period_total if self.period_total > 0 else None
+
+  def get_cpu_util(self):
+    # cpu -> utilization (%) in last sample
+    return dict(zip(self.cpus, self.cpu_util))
+
+  def get_stats(self):
+    return {"Util": self.last_util,
+            "PeriodUtil": self.get_period_util(),
+            "MaxCpuUtil": self.max_cpu_util,
+            "PkgUtil": dict(self.pkg_util) }
@@ -19,6 +19,8 @@ class MQTTClient(object):
     self.sub_topic = config.get("topic", None)
     self.pub_topic = config.get("pubtopic", None)
     self.pub_fields = config.get("pubfields", None)
+    # optional callback for received messages, otherwise they are queued for get_msg()
+    self.on_msg = None
     if self.pub_fields:
       self.pub_fields = self.pub_fields.split(",")
         
@@ -50,7 +52,10 @@ class MQTTClient(object):
       return
     await client.subscribe(self.sub_topic)
     async for message in client.messages:
-      self.recv_queue.put_nowait(message.payload)
+      if self.on_msg:
+        self.on_msg(message.payload)
+      else:
+        self.recv_queue.put_nowait(message.payload)
     
   async def handle_pub(self, client):
     if not self.pub_topic:
@@ -1,26 +1,154 @@
+import time
+
 from ecofreq.policy.governor import Governor
 
+class SetpointFilter(object):
+  def __init__(self, config, vmin, vmax, units):
+    # min change of input signal (e.g. gCO2/kWh) needed to switch to a new setpoint
+    self.hysteresis = float(config.get("hysteresis", 0))
+    # min time (sec) between setpoint changes
+    self.dwell = int(config.get("dwelltime", 0))
+    # max setpoint change per minute, e.g. 10% or 20W
+    self.ramp_str = config.get("ramprate", None)
+    self.ramp = Governor.parse_val(self.ramp_str.lower(), 0, vmax, units) / 60. if self.ramp_str else 0.
+    self.reset()
+
+  def reset(self):
+    self.target = self.val = None
+    self.last_input = None
+    self.last_change = self.last_ts = 0
+
+  @classmethod
+  def from_config(cls, config, vmin, vmax, units):
+    f = SetpointFilter(config, vmin, vmax, units)
+    return f if f.hysteresis or f.dwell or f.ramp else None
+
+  def info_string(self):
+    s = []
+    if self.hysteresis:
+      s.append("hysteresis = {0}".format(self.hysteresis))
+    if self.dwell:
+      s.append("dwell = {0} sec".format(self.dwell))
+    if self.ramp:
+      s.append("ramp = {0}/min".format(self.ramp_str))
+    return ", ".join(s)
+
+  def get_config(self, config):
+    config["hysteresis"] = self.hysteresis
+    config["dwelltime"] = self.dwell
+    if self.ramp_str:
+      config["ramprate"] = self.ramp_str
+    return config
+
+  def in_band(self, inp):
+    try:
+      return abs(float(inp) - self.last_input) <= self.hysteresis
+    except (TypeError, ValueError):
+      # non-numeric input (e.g. traffic light) 
+      return False
+
+  def update(self, inp, target, ts):
+    if target is None:
+      return self.val
+    if self.target is None:
+      self.target = self.val = target
+      self.last_change = self.last_ts = ts
+    elif target != self.target:
+      if self.hysteresis and self.in_band(inp):
+        pass
+      elif ts - self.last_change < self.dwell:
+        pass
+      else:
+        self.target = target
+        self.last_change = ts
+    if self.target == target:
+      self.last_input = inp
+    return self.step(ts)
+
+  def ramping(self):
+    return self.val != self.target
+
+  def step(self, ts):
+    if self.ramp and self.val is not None:
+      maxd = self.ramp * (ts - self.last_ts)
+      delta = self.target - self.val
+      self.val = self.target if abs(delta) <= maxd else self.val + (maxd if delta > 0 else -maxd)
+    else:
+      self.val = self.target
+    self.last_ts = ts
+    return self.val
+
 class EcoPolicy(object):
   UNIT={}
   def __init__(self, config):
     self.debug = False
+    self.filter = None
 
   def info_string(self):
     g = self.governor.info_string(self.UNIT) if self.governor else "None" 
+    if self.filter:
+      g += ", " + self.filter.info_string()
     return type(self).__name__ + " (governor = " + g + ")" 
 
   def init_governor(self, config, vmin, vmax, vround=None):
     self.governor = Governor.from_config(config, vmin, vmax, self.UNIT)
     if self.governor and vround:
       self.governor.val_round = vround
+    self.filter = SetpointFilter.from_config(config, vmin, vmax, self.UNIT)
       
   def get_config(self, config={}):
     config["control"] = type(self).__name__
     config["governor"] = self.governor.info_string(self.UNIT) if self.governor else "none"
+    if self.governor:
+      for m, g in self.governor.sub_governors().items():
+        config[Governor.SUB_PREFIX + m] = g.info_string(self.UNIT)
+    if self.filter:
+      self.filter.get_config(config)
     return config
   
+  def get_input(self, co2_data, field):
+    if self.governor:
+      return self.governor.get_input(co2_data, field)
+    else:
+      return co2_data.get(field)
+
+  def update_forecast(self, provider, field, ts):
+    if self.governor:
+      self.governor.update_forecast(provider, field, ts)
+
+  def set_totals(self, totals, ts):
+    if self.governor:
+      self.governor.set_totals(totals, ts)
+
   def co2val(self, co2):
     if self.governor:
-      return self.governor.co2val(co2)
+      val = self.governor.co2val(co2)
+      if self.filter:
+        val = self.round_val(self.filter.update(self.governor.filter_input(co2), val, time.time()))
+      return val
     else:
       return None
+
+  def round_val(self, val):
+    # intermediate values while ramping
+    return self.governor.round_val(val) if self.filter.ramping() else val
+
+  def apply(self, val):
+    pass
+
+  # subclasses must override this to restore full performance, and call EcoPolicy.reset()
+  def reset(self):
+    if self.filter:
+      self.filter.reset()
+
+  def init_monitors(self, monitor):
+    pass
+
+  # called at every monitoring interval
+  def tick(self, ts):
+    self.ramp(ts)
+
+  def ramp(self, ts):
+    # continue ramping towards target setpoint between policy updates
+    if self.filter and self.filter.ramping():
+      self.apply(self.round_val(self.filter.step(ts)))
@@ -6,6 +6,7 @@ from ecofreq.helpers.amd import AMDEsmiHelper
 from ecofreq.helpers.cgroup import LinuxCgroupHelper, LinuxCgroupV1Helper, LinuxCgroupV2Helper
 from ecofreq.helpers.docker import DockerHelper
 from ecofreq.policy.common import EcoPolicy
+from ecofreq.monitors.energy import EnergyMonitor
 from ecofreq.config import OPTION_DISABLED
 
 
@@ -46,6 +47,8 @@ class CPUEcoPolicy(EcoPolicy):
       return CPUCgroupEcoPolicy(config)
     elif c == "docker":
       return CPUDockerEcoPolicy(config)
+    elif c == "powerloop":
+      return CPUPowerLoopEcoPolicy(config)
     elif c in OPTION_DISABLED:
       return None
     else:
@@ -73,10 +76,15 @@ class CPUFreqEcoPolicy(CPUEcoPolicy):
       CpuFreqHelper.set_gov_max_freq(freq)    
 
   def set_co2(self, co2):
-    self.freq = self.co2val(co2)
+    val = self.co2val(co2)
+    self.apply(val)
+
+  def apply(self, val):
+    self.freq = val
     self.set_freq(self.freq)
 
   def reset(self):
+    EcoPolicy.reset(self)
     self.set_freq(self.fmax)
 
 class CPUPowerEcoPolicy(CPUEcoPolicy):
@@ -110,11 +118,16 @@ class CPUPowerEcoPolicy(CPUEcoPolicy):
       self.helper.set_power_limit(power_w, self.helper.WATT)
 
   def set_co2(self, co2):
-    self.power = self.co2val(co2)
-#  print("Update policy co2 -> power:", co2, "->", self.power)
+    val = self.co2val(co2)
+#  print("Update policy co2 -> power:", co2, "->", val)
+    self.apply(val)
+
+  def apply(self, val):
+    self.power = val
     self.set_power(self.power)
 
   def reset(self):
+    EcoPolicy.reset(self)
     self.set_power(self.pmax)
 
 class CPUCgroupEcoPolicy(CPUEcoPolicy):
@@ -160,11 +173,16 @@ class CPUCgroupEcoPolicy(CPUEcoPolicy):
       self.helper.set_cpu_quota(self.grp, quota)
 
   def set_co2(self, co2):
-    self.quota = self.co2val(co2)
-#    print("Update policy co2 -> power: ", co2, "->", self.power)
+    val = self.co2val(co2)
+#    print("Update policy co2 -> power: ", co2, "->", val)
+    self.apply(val)
+
+  def apply(self, val):
+    self.quota = val
     self.set_quota(self.quota)
 
   def reset(self):
+    EcoPolicy.reset(self)
     self.set_quota(self.qmax)
 
 class CPUDockerEcoPolicy(CPUEcoPolicy):
@@ -199,9 +217,114 @@ class CPUDockerEcoPolicy(CPUEcoPolicy):
       DockerHelper.set_container_cpus(self.ctrs, cpu_quota)
 
   def set_co2(self, co2):
-    self.quota = self.co2val(co2)
-#    print("Update policy co2 -> power: ", co2, "->", self.power)
+    val = self.co2val(co2)
+#    print("Update policy co2 -> power: ", co2, "->", val)
+    self.apply(val)
+
+  def apply(self, val):
+    self.quota = val
     self.set_quota(self.quota)
 
   def reset(self):
+    EcoPolicy.reset(self)
     self.set_quota(self.qstart)
+
+class CPUPowerLoopEcoPolicy(CPUEcoPolicy):
+  UNIT={"W": 1}
+  
+  def __init__(self, config):
+    EcoPolicy.__init__(self, config)
+
+    # actuator: frequency or cgroup policy without governor 
+    act = config.get("loopcontrol", "auto").lower()
+    if act == "auto":
+      act = "frequency" if CpuFreqHelper.available() else "cgroup"
+    act_cfg = dict(config)
+    act_cfg["governor"] = "none"
+    if act == "frequency":
+      self.actuator = CPUFreqEcoPolicy(act_cfg)
+      self.amin, self.amax = self.actuator.fmin, self.actuator.fmax
+    elif act == "cgroup":
+      self.actuator = CPUCgroupEcoPolicy(act_cfg)
+      # do not freeze cgroup completely
+      self.amin, self.amax = 0.05 * self.actuator.qmax, self.actuator.qmax
+    else:
+      raise ValueError("Unknown power loop control: " + act)
+    
+    if "maxpower" not in config:
+      print ("ERROR: Please specify MaxPower for powerloop policy!")
+      sys.exit(-1)
+    self.pmax = float(config["maxpower"])
+    self.pmin = 0.1 * self.pmax
+    # PI gains: error is normalized by pmax, output by actuator range, ki is per second
+    self.kp = float(config.get("kp", 0.5))
+    self.ki = float(config.get("ki", 0.05))
+    self.monitor = None
+    self.energy_monitor = None
+    self.power = self.pmax
+    self.reset_loop()
+    self.init_governor(config, self.pmin, self.pmax)
+
+  def info_string(self):
+    s = super().info_string()
+    return s + ", actuator = {0} (kp = {1}, ki = {2})".format(type(self.actuator).__name__, self.kp, self.ki)
+
+  def get_config(self, config={}):
+    super().get_config(config)
+    config["loopcontrol"] = "frequency" if isinstance(self.actuator, CPUFreqEcoPolicy) else "cgroup"
+    config["maxpower"] = self.pmax
+    config["kp"] = self.kp
+    config["ki"] = self.ki
+    return config
+
+  def init_monitors(self, monitor):
+    self.monitor = monitor
+    self.energy_monitor = monitor.get_by_class(EnergyMonitor)
+    if not self.energy_monitor:
+      print ("ERROR: powerloop policy requires a power/energy monitor!")
+      sys.exit(-1)
+
+  def reset_loop(self):
+    # start at full speed
+    self.integ = 1.0
+    self.last_ts = None
+    self.last_samples = None
+
+  def set_co2(self, co2):
+    val = self.co2val(co2)
+    self.apply(val)
+
+  def apply(self, val):
+    # target power, actuator is adjusted at every monitoring interval
+    if val:
+      self.power = val
+
+  def tick(self, ts):
+    super().tick(ts)
+    if not self.energy_monitor:
+      return
+    # only step the controller on a new power measurement
+    samples = self.energy_monitor.total_samples
+    if samples == self.last_samples:
+      return
+    self.last_samples = samples
+    power = self.monitor.get_last_avg_power()
+    if self.last_ts is not None and power:
+      dt = ts - self.last_ts
+      err = (self.power - power) / self.pmax
+      integ = self.integ + self.ki * err * dt
+      u_raw = self.kp * err + integ
+      u = min(max(u_raw, 0.), 1.)
+      # anti-windup: stop integrating while output is saturated 
+      if u == u_raw:
+        self.integ = integ
+      else:
+        self.integ = min(max(self.integ, 0.), 1.)
+      # sysfs/cgroup files only accept integer values
+      self.actuator.apply(int(min(max(round(self.amin + u * (self.amax - self.amin)), self.amin), self.amax)))
+    self.last_ts = ts
+
+  def reset(self):
+    EcoPolicy.reset(self)
+    self.reset_loop()
+    self.actuator.reset()
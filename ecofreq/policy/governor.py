@@ -1,7 +1,14 @@
+import time
+import bisect
+from collections import deque
+from datetime import datetime, timedelta
+
 from ecofreq.config import OPTION_DISABLED
 
 class Governor(object):
   LABEL="None"
+  # config key prefix for per-metric sub-governors, e.g. governor_co2=linear:100:500
+  SUB_PREFIX="governor_"
 
   def __init__(self, args, vmin, vmax):
     self.val_round = 3
@@ -24,6 +31,43 @@ class Governor(object):
   def round_val(self, val):
     return int(round(val, self.val_round))
 
+  # forecast horizon (sec) needed by this governor, 0 = forecast not used
+  def forecast_horizon(self):
+    return 0
+
+  def update_forecast(self, provider, field, ts):
+    horizon = self.forecast_horizon()
+    if horizon > 0:
+      self.set_forecast(provider.get_forecast(field, ts, ts + horizon), ts)
+
+  def set_forecast(self, forecast, ts):
+    pass
+
+  @classmethod
+  def forecast_key(cls, forecast):
+    # forecast is clipped to [ts, ts + horizon) -> ignore moving start of first and end of last slot
+    if not forecast:
+      return forecast
+    key = list(forecast)
+    key[0] = (None,) + tuple(key[0][1:])
+    key[-1] = tuple(key[-1][:1]) + (None,) + tuple(key[-1][2:])
+    return key
+
+  # governor input: value of the policy metric, or None if not available
+  def get_input(self, co2_data, field):
+    return co2_data.get(field)
+
+  # scalar signal value for setpoint hysteresis
+  def filter_input(self, inp):
+    return inp
+
+  def sub_governors(self):
+    return {}
+
+  # cumulative totals since daemon start: co2 (g) and cost (ct)
+  def set_totals(self, totals, ts):
+    pass
+
   @classmethod
   def parse_args(cls, toks):
     args = {}
@@ -63,6 +107,8 @@ class Governor(object):
   def from_config(cls, config, vmin, vmax, units):
     govstr = config["governor"].lower()
     if govstr == "default":
+      if "defaultgovernor" not in config:
+        raise ValueError("Default governor requested, but DefaultGovernor is not defined")
       govstr = config["defaultgovernor"].lower()
     toks = govstr.split(":")
     t = toks[0] 
@@ -78,6 +124,14 @@ class Governor(object):
       return ConstantGovernor(args, vmin, vmax, units)
     elif t == "const":
       return ConstantGovernor(args, vmin, vmax, units)
+    elif t == "plan":
+      return PlanGovernor(args, vmin, vmax, units)
+    elif t == "budget":
+      return BudgetGovernor(args, vmin, vmax, units)
+    elif t == "rank":
+      return RankGovernor(args, vmin, vmax, units)
+    elif t == "composite":
+      return CompositeGovernor(args, vmin, vmax, units, config)
     elif t in OPTION_DISABLED:
       return None
     else:
@@ -167,8 +221,329 @@ class StepGovernor(Governor):
     val = int(round(val, self.val_round))
     return val
 
+class RankGovernor(StepGovernor):
+  LABEL="rank"
+
+  # rank:horizon=24:history=24:30=80%:70=50%
+  # steps are defined on percentile rank (0..100) of the current value within upcoming forecast 
+  # and recent history windows (in hours), e.g. above: full speed in the greenest/cheapest 30% 
+  def __init__(self, args, vmin, vmax, units):
+    args = dict(args)
+    self.horizon = int(float(args.pop("horizon", None) or 24) * 3600)
+    self.history_len = int(float(args.pop("history", None) or 24) * 3600)
+    StepGovernor.__init__(self, args, vmin, vmax, units)
+    # forecast slots (value, start, end) sorted by value; only re-sorted if forecast has changed
+    self.forecast_recs = []
+    self.forecast_key_last = None
+    # history values in arrival order (for expiry) and sorted (for rank lookups)
+    self.history = deque()
+    self.history_sorted = []
+
+  def info_string(self, unit={"": 1}):
+    s = StepGovernor.info_string(self, unit)
+    return s + ":horizon={0:g}:history={1:g}".format(self.horizon / 3600, self.history_len / 3600)
+
+  def forecast_horizon(self):
+    return self.horizon
+
+  def set_forecast(self, forecast, ts):
+    key = self.forecast_key(forecast)
+    if key == self.forecast_key_last:
+      return
+    self.forecast_key_last = key
+    try:
+      recs = sorted([(float(v), t1, t2) for t1, t2, v in forecast or []])
+    except (TypeError, ValueError):
+      recs = []
+    self.forecast_recs = recs
+
+  def add_history(self, val, ts):
+    self.history.append((ts, val))
+    bisect.insort(self.history_sorted, val)
+    while self.history and self.history[0][0] < ts - self.history_len:
+      t, v = self.history.popleft()
+      del self.history_sorted[bisect.bisect_left(self.history_sorted, v)]
+
+  def rank(self, val, ts):
+    # percentile rank weighted by time (sec), ties count half
+    below = equal = total = 0.
+    # forecast slots may differ in length (e.g. 15 vs. 60 min), and are clipped to current horizon
+    for v, t1, t2 in self.forecast_recs:
+      d = max(min(t2, ts + self.horizon) - max(t1, ts), 0)
+      total += d
+      if v < val:
+        below += d
+      elif v == val:
+        equal += d
+    # history samples are evenly spaced -> every sample covers an equal share of the time since the oldest one
+    n = len(self.history_sorted)
+    if n > 0:
+      w = (ts - self.history[0][0]) / n
+      lo = bisect.bisect_left(self.history_sorted, val)
+      hi = bisect.bisect_right(self.history_sorted, val, lo)
+      below += lo * w
+      equal += (hi - lo) * w
+      total += n * w
+    if total <= 0:
+      return 0.
+    return 100. * (below + 0.5 * equal) / total
+
+  def co2val(self, co2):
+    co2 = float(co2)
+    ts = time.time()
+    r = self.rank(co2, ts)
+    if self.history_len > 0:
+      self.add_history(co2, ts)
+    return StepGovernor.co2val(self, r)
+
 class ListGovernor(StepGovernor):
   LABEL="list"
 
   def __init__(self, args, vmin, vmax, units):
     StepGovernor.__init__(self, args, vmin, vmax, units, True)
+
+class PlanGovernor(Governor):
+  LABEL="plan"
+
+  # plan:target=70%:horizon=12[:min=40%]
+  # target = average cap value over the planning window of <horizon> hours, i.e. energy (power cap)
+  # or throughput (frequency cap) budget, which is allocated to the slots with lowest metric value first
+  def __init__(self, args, vmin, vmax, units):
+    Governor.__init__(self, args, vmin, vmax)
+    self.vmax = vmax
+    self.target = Governor.parse_val(args.get("target") or "max", vmin, vmax, units)
+    self.vfloor = Governor.parse_val(args.get("min") or "min", vmin, vmax, units)
+    self.horizon = int(float(args.get("horizon") or 12) * 3600)
+    if self.vfloor > self.target:
+      raise ValueError("Plan governor: min value exceeds target: " + args.get("min"))
+    self.forecast = None
+    self.plan = []
+    self.plan_start = self.plan_end = 0
+    # cap value x seconds already delivered in the current planning window
+    self.work = 0.
+    self.last_ts = self.last_val = None
+
+  def info_string(self, unit={"": 1}):
+    uname, ufactor = list(unit.items())[0]
+    return "{0}:target={1}{2}:horizon={3:g}:min={4}{2}".format(self.LABEL, self.round_val(self.target) / ufactor, uname, 
+                                                             self.horizon / 3600, self.round_val(self.vfloor) / ufactor)
+
+  def forecast_horizon(self):
+    return self.horizon
+
+  def set_forecast(self, forecast, ts):
+    # re-plan only if forecast has changed
+    if self.forecast_key(forecast) != self.forecast_key(self.forecast):
+      self.account(ts)
+      self.forecast = forecast
+      self.replan(ts)
+
+  def account(self, ts):
+    if self.last_ts and self.last_val is not None:
+      self.work += self.last_val * (min(ts, self.plan_end) - max(self.last_ts, self.plan_start))
+    self.last_ts = ts
+
+  def new_window(self, ts):
+    self.plan_start, self.plan_end = ts, ts + self.horizon
+    self.work = 0.
+
+  def get_slots(self, ts):
+    slots = []
+    for t1, t2, v in self.forecast or []:
+      t1, t2 = max(t1, ts), min(t2, self.plan_end)
+      if t2 > t1:
+        try:
+          slots.append((t1, t2, float(v)))
+        except (TypeError, ValueError):
+          # non-numeric forecast (e.g. traffic light)
+          return []
+    return slots
+
+  def replan(self, ts):
+    if ts >= self.plan_end:
+      self.new_window(ts)
+    slots = self.get_slots(ts)
+    if not slots:
+      self.plan = []
+      return
+    # remaining budget for [ts, plan_end); time not covered by forecast is assumed to run at target 
+    covered = sum([t2 - t1 for t1, t2, v in slots])
+    uncovered = self.plan_end - ts - covered
+    budget = self.target * (self.plan_end - self.plan_start) - self.work - self.target * uncovered
+    # every slot gets at least the floor value, the rest is distributed greedily starting from the slot with 
+    # the lowest co2/price (= optimal solution of the LP relaxation, since cost is linear in cap value) 
+    extra = budget - self.vfloor * covered
+    plan = []
+    for t1, t2, v in sorted(slots, key=lambda x: x[2]):
+      add = min(max(extra, 0), (self.vmax - self.vfloor) * (t2 - t1))
+      extra -= add
+      plan.append((t1, t2, self.vfloor + add / (t2 - t1)))
+    self.plan = sorted(plan)
+
+  def co2val(self, co2):
+    ts = time.time()
+    self.account(ts)
+    if ts >= self.plan_end:
+      self.new_window(ts)
+      self.replan(ts)
+    val = self.target
+    for t1, t2, v in self.plan:
+      if t1 <= ts < t2:
+        val = v
+        break
+    self.last_val = val
+    return int(round(val, self.val_round))
+
+class BudgetGovernor(Governor):
+  LABEL="budget"
+  # budget is given in kg (co2) or EUR (cost), totals are tracked in g and ct, respectively 
+  BUDGET_UNITS = {"co2": ("kg", 1000.), "cost": ("EUR", 100.)}
+  PERIODS = ["day", "week", "month"]
+
+  # budget:co2=50:period=month, budget:cost=20:period=7
+  def __init__(self, args, vmin, vmax, units):
+    Governor.__init__(self, args, vmin, vmax)
+    self.vmin = vmin
+    self.vmax = vmax
+    self.field = None
+    for f in self.BUDGET_UNITS.keys():
+      if args.get(f):
+        self.field = f
+        self.budget = float(args[f]) * self.BUDGET_UNITS[f][1]
+    if not self.field:
+      raise ValueError("Budget governor: please specify co2=<kg> or cost=<EUR>")
+    self.period = args.get("period") or "month"
+    if self.period not in self.PERIODS:
+      # period length in days
+      self.period_days = float(self.period)
+    self.val = vmax
+    self.win_end = 0
+    self.last_ts = self.last_total = None
+
+  def info_string(self, unit={"": 1}):
+    uname, ufactor = self.BUDGET_UNITS[self.field]
+    return "{0}:{1}={2}:period={3}".format(self.LABEL, self.field, self.budget / ufactor, self.period)
+
+  def period_bounds(self, ts):
+    now = datetime.fromtimestamp(ts)
+    today = datetime(now.year, now.month, now.day)
+    if self.period == "day":
+      start = today
+      end = start + timedelta(days=1)
+    elif self.period == "week":
+      start = today - timedelta(days=today.weekday())
+      end = start + timedelta(days=7)
+    elif self.period == "month":
+      start = today.replace(day=1)
+      end = (start + timedelta(days=32)).replace(day=1)
+    else:
+      return ts, ts + self.period_days * 86400
+    return start.timestamp(), end.timestamp()
+
+  def set_totals(self, totals, ts):
+    total = totals.get(self.field)
+    if total is None:
+      return
+    if ts >= self.win_end:
+      start, end = self.period_bounds(ts)
+      # usage before (re)start is unknown, so assume it was on track
+      self.win_budget = self.budget * (end - ts) / (end - start)
+      self.win_end = end
+      self.win_total = total
+      self.val = self.vmax
+    else:
+      remaining = self.win_budget - (total - self.win_total)
+      rate = (total - self.last_total) / (ts - self.last_ts) if ts > self.last_ts else 0
+      if remaining <= 0:
+        self.val = self.vmin
+      elif rate > 0:
+        # allowed burn rate to stay on the budget trajectory: scale cap accordingly, i.e. 
+        # relax it as long as we are below the plan, and tighten it only if burn rate is too high
+        allowed_rate = remaining / (self.win_end - ts)
+        self.val = min(max(self.val * allowed_rate / rate, self.vmin), self.vmax)
+      else:
+        self.val = self.vmax
+    self.last_ts = ts
+    self.last_total = total
+
+  def co2val(self, co2):
+    return int(round(self.val, self.val_round))
+
+class CompositeGovernor(Governor):
+  LABEL="composite"
+  MODES=["min", "max", "weighted"]
+
+  # composite:min, composite:max:co2:price, composite:weighted:co2=0.7:price=0.3
+  # sub-governors are defined per metric with governor_<metric>, e.g. governor_price=step:30=80%
+  def __init__(self, args, vmin, vmax, units, config):
+    Governor.__init__(self, args, vmin, vmax)
+    args = dict(args)
+    self.mode = "min"
+    for m in self.MODES:
+      if m in args:
+        self.mode = m
+        args.pop(m)
+    metrics = list(args.keys())
+    if not metrics:
+      metrics = [k[len(self.SUB_PREFIX):] for k in config.keys() if k.startswith(self.SUB_PREFIX)]
+    self.governors = {}
+    self.weights = {}
+    for m in metrics:
+      key = self.SUB_PREFIX + m
+      if key not in config:
+        raise ValueError("Composite governor: sub-governor not defined: " + key)
+      sub_config = {"governor": config[key]}
+      if "defaultgovernor" in config:
+        sub_config["defaultgovernor"] = config["defaultgovernor"]
+      g = Governor.from_config(sub_config, vmin, vmax, units)
+      if g:
+        self.governors[m] = g
+        self.weights[m] = float(args.get(m) or 1.)
+    if not self.governors:
+      raise ValueError("Composite governor: no sub-governors defined")
+
+  def info_string(self, unit={"": 1}):
+    args = [self.LABEL, self.mode]
+    for m in self.governors.keys():
+      args.append("{0}={1}".format(m, self.weights[m]) if self.mode == "weighted" else m)
+    return ":".join(args)
+
+  def sub_governors(self):
+    return self.governors
+
+  def update_forecast(self, provider, field, ts):
+    for m, g in self.governors.items():
+      g.update_forecast(provider, m, ts)
+
+  def set_totals(self, totals, ts):
+    for g in self.governors.values():
+      g.set_totals(totals, ts)
+
+  def get_input(self, co2_data, field):
+    for m in self.governors.keys():
+      if co2_data.get(m) is not None:
+        return co2_data
+    return None
+
+  def filter_input(self, inp):
+    # hysteresis applies to the primary (= first available) metric
+    for m in self.governors.keys():
+      if inp.get(m) is not None:
+        return inp[m]
+    return None
+
+  def co2val(self, co2_data):
+    vals = {}
+    for m, g in self.governors.items():
+      if co2_data.get(m) is not None:
+        vals[m] = g.co2val(co2_data[m])
+    if not vals:
+      return None
+    if self.mode == "max":
+      val = max(vals.values())
+    elif self.mode == "weighted":
+      wsum = sum([self.weights[m] for m in vals.keys()])
+      val = sum([self.weights[m] * v for m, v in vals.items()]) / wsum
+    else:
+      val = min(vals.values())
+    return int(round(val, self.val_round))
@@ -68,11 +68,16 @@ class GPUPowerEcoPolicy(GPUEcoPolicy):
       NvidiaGPUHelper.set_power_limit(power_w)
 
   def set_co2(self, co2):
-    self.power = self.co2val(co2)
-#    print("Update policy co2 -> power: ", co2, "->", self.power)
+    val = self.co2val(co2)
+#    print("Update policy co2 -> power: ", co2, "->", val)
+    self.apply(val)
+
+  def apply(self, val):
+    self.power = val
     self.set_power(self.power)
 
   def reset(self):
+    EcoPolicy.reset(self)
     self.set_power(self.pmax)
 
 class GPUFreqEcoPolicy(GPUEcoPolicy):
@@ -94,8 +99,13 @@ class GPUFreqEcoPolicy(GPUEcoPolicy):
       NvidiaGPUHelper.set_freq_limit(freq)    
 
   def set_co2(self, co2):
-    self.freq = self.co2val(co2)
+    val = self.co2val(co2)
+    self.apply(val)
+
+  def apply(self, val):
+    self.freq = val
     self.set_freq(self.freq)
 
   def reset(self):
+    EcoPolicy.reset(self)
     NvidiaGPUHelper.reset_freq_limit()
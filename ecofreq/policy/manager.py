@@ -1,10 +1,23 @@
+import time
+
+from ecofreq.config import OPTION_DISABLED
 from ecofreq.providers.common import EcoProvider
+from ecofreq.monitors.pressure import PressureMonitor
 from ecofreq.policy.cpu import CPUEcoPolicy
 from ecofreq.policy.gpu import GPUEcoPolicy
 
 class EcoPolicyManager(object):
   def __init__(self, config):
     self.policies = []
+    self.monitor = None
+    # sec, restore full performance for this time when a PSI trigger fires
+    mcfg = config["monitor"] if "monitor" in config else {}
+    boost = str(mcfg.get("PressureBoost", "off")).lower()
+    self.boost_time = 0 if boost in OPTION_DISABLED else int(boost)
+    # CPU pressure builds up whenever the node is fully loaded, so by default react only to memory/IO stalls 
+    self.boost_resources = [r.strip() for r in mcfg.get("PressureBoostResources", "memory,io").split(",")]
+    self.boost_until = None
+    self.last_co2_data = None
     cfg_dict = {"cpu": None, "gpu": None}
     if "policy" in config:
       cfg_dict["gpu"] = cfg_dict["cpu"] = dict(config.items("policy"))  
@@ -45,6 +58,8 @@ class EcoPolicyManager(object):
       self.policies.append(cpu_pol)
     if gpu_pol:
       self.policies.append(gpu_pol)
+    if self.monitor:
+      self.init_monitors(self.monitor)
 
   def get_config(self):
     res = {}
@@ -58,7 +73,7 @@ class EcoPolicyManager(object):
       res[domain]["metric"] = self.metric
     return res
     
-  def set_co2(self, co2_data):
+  def get_field(self):
     if self.metric == "price":
       field = EcoProvider.FIELD_PRICE
     elif self.metric == "fossil_pct":
@@ -69,11 +84,58 @@ class EcoPolicyManager(object):
       field = EcoProvider.FIELD_INDEX
     else:
       field = EcoProvider.FIELD_CO2
-    if not co2_data[field] is None:
-      val = co2_data[field]
-      for p in self.policies:
+    return field
+
+  def update_forecast(self, provider):
+    ts = time.time()
+    field = self.get_field()
+    for p in self.policies:
+      p.update_forecast(provider, field, ts)
+
+  def set_totals(self, totals):
+    ts = time.time()
+    for p in self.policies:
+      p.set_totals(totals, ts)
+
+  def set_co2(self, co2_data):
+    self.last_co2_data = co2_data
+    if self.boost_until:
+      # will be applied once boost is over
+      return
+    field = self.get_field()
+    for p in self.policies:
+      # single metric value, or full co2_data for multi-metric governors 
+      val = p.get_input(co2_data, field)
+      if not val is None:
         p.set_co2(val)
 
+  def init_monitors(self, monitor):
+    self.monitor = monitor
+    for p in self.policies:
+      p.init_monitors(monitor)
+    psimon = monitor.get_by_class(PressureMonitor)
+    if self.boost_time and psimon and self.on_pressure not in psimon.listeners:
+      psimon.add_listener(self.on_pressure)
+
+  def on_pressure(self, resource):
+    # tasks are stalling -> lift all caps right away instead of waiting for the next policy update
+    if resource not in self.boost_resources:
+      return
+    if not self.boost_until:
+      self.reset()
+    self.boost_until = time.time() + self.boost_time
+
+  def tick(self):
+    ts = time.time()
+    if self.boost_until:
+      if ts < self.boost_until:
+        return
+      self.boost_until = None
+      if self.last_co2_data:
+        self.set_co2(self.last_co2_data)
+    for p in self.policies:
+      p.tick(ts)
+
   def reset(self):
     for p in self.policies:
       p.reset()
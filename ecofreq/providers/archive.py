@@ -0,0 +1,137 @@
+import gzip
+import json
+import time
+import bisect
+import urllib.request
+from urllib.parse import urlsplit
+
+from ecofreq.config import OPTION_DISABLED
+from ecofreq.providers.common import EcoProvider
+
+class ProviderRecorder(object):
+  def __init__(self, fname):
+    self.fname = fname
+
+  @classmethod
+  def from_config(cls, config):
+    fname = config["provider"].get("record", None)
+    if not fname or fname.lower() in OPTION_DISABLED:
+      return None
+    return ProviderRecorder(fname)
+
+  def record(self, label, url, resp):
+    if isinstance(resp, bytes):
+      resp = resp.decode("utf-8")
+    entry = {"ts": time.time(), "label": label, "url": url, "resp": resp}
+    # every record is appended as a separate gzip member, so archive stays readable after a crash 
+    try:
+      with gzip.open(self.fname, "at", encoding="utf-8") as f:
+        f.write(json.dumps(entry) + "\n")
+    except OSError as e:
+      print("WARNING: Failed to record provider response:", e)
+
+class ProviderArchive(object):
+  # requests which are less than CYCLE_GAP seconds apart belong to the same get_data() call 
+  CYCLE_GAP = 5
+
+  def __init__(self, fname, label=None):
+    self.fname = fname
+    entries = {}
+    with gzip.open(fname, "rt", encoding="utf-8") as f:
+      for line in f:
+        entry = json.loads(line)
+        if label and entry["label"] != label:
+          continue
+        entries.setdefault(self.url_key(entry["url"]), []).append((entry["ts"], entry["resp"]))
+    # sort once after loading; stable, so that equal timestamps keep file order
+    self.responses = {}
+    for key, recs in entries.items():
+      recs.sort(key=lambda r: r[0])
+      self.responses[key] = ([r[0] for r in recs], [r[1] for r in recs])
+    self.init_cycles()
+
+  @classmethod
+  def url_key(cls, url):
+    # ignore query string, since it often contains volatile parameters (e.g. start/end time)
+    parts = urlsplit(url)
+    return parts.netloc + parts.path
+
+  def init_cycles(self):
+    all_ts = sorted([ts for ts_list, _ in self.responses.values() for ts in ts_list])
+    self.cycles = []
+    for ts in all_ts:
+      if self.cycles and ts - self.cycles[-1] < self.CYCLE_GAP:
+        self.cycles[-1] = ts
+      else:
+        self.cycles.append(ts)
+
+  def start_ts(self):
+    return self.cycles[0]
+
+  def end_ts(self):
+    return self.cycles[-1]
+
+  def lookup(self, url, ts):
+    # most recent response recorded at or before ts
+    key = self.url_key(url)
+    if key not in self.responses:
+      return None
+    ts_list, resp_list = self.responses[key]
+    i = bisect.bisect_right(ts_list, ts) - 1
+    return resp_list[i] if i >= 0 else None
+
+class ReplayProvider(EcoProvider):
+  LABEL="replay"
+
+  def __init__(self, config, glob_interval, provider):
+    EcoProvider.__init__(self, config, glob_interval)
+    self.provider = provider
+    self.set_config(config)
+
+  def info_string(self):
+    return "{0} ({1}, archive = {2}, speed = {3})".format(type(self).__name__, self.provider.LABEL, self.archive_fname, self.speed)
+
+  def get_config(self):
+    cfg = super().get_config()
+    cfg["archive"] = self.archive_fname
+    cfg["provider"] = self.provider.LABEL
+    cfg["speed"] = self.speed
+    return cfg
+
+  def set_config(self, config):
+    self.archive_fname = config["archive"]
+    # 1 = recorded time, >1 = accelerated, 0 = advance by one recorded fetch on each call
+    self.speed = float(config.get("speed", 1))
+    self.archive = ProviderArchive(self.archive_fname, self.provider.LABEL)
+    if not self.archive.cycles:
+      raise ValueError("No recorded responses for provider {0} in archive: {1}".format(self.provider.LABEL, self.archive_fname))
+    self.step = 0
+    self.replay_start = time.time()
+    # route all I/O and clock of the wrapped provider through the archive
+    self.provider.http_read = self.replay_read
+    self.provider.session_read = self.replay_read
+    self.provider.offline = True
+    self.provider.now = self.now
+
+  def now(self):
+    if self.speed > 0:
+      duration = self.archive.end_ts() - self.archive.start_ts() + self.interval
+      elapsed = (time.time() - self.replay_start) * self.speed
+      return self.archive.start_ts() + elapsed % duration
+    else:
+      return self.archive.cycles[self.step % len(self.archive.cycles)]
+
+  def replay_read(self, req, data=None):
+    url = req.full_url if isinstance(req, urllib.request.Request) else req
+    resp = self.archive.lookup(url, self.now())
+    if resp is None:
+      raise ValueError("No recorded response for URL: " + url)
+    return resp.encode("utf-8")
+
+  def get_data(self):
+    data = self.provider.get_data()
+    self.step += 1
+    return data
+
+  def get_forecast(self, metric, start, end):
+    return self.provider.get_forecast(metric, start, end)
@@ -0,0 +1,88 @@
+import os
+import json
+import time
+import hashlib
+from datetime import datetime, date
+
+from ecofreq.config import OPTION_DISABLED, CACHE_DIR
+
+class ProviderCache(object):
+  FILE_EXT = ".json"
+
+  def __init__(self, cache_dir):
+    self.cache_dir = cache_dir
+
+  @classmethod
+  def from_config(cls, config):
+    cache_dir = config["provider"].get("cachedir", CACHE_DIR)
+    if not cache_dir or cache_dir.lower() in OPTION_DISABLED:
+      return None
+    cache = ProviderCache(cache_dir)
+    cache.purge()
+    return cache
+
+  @classmethod
+  def window(cls, ttl, ts, local=False):
+    # align entries to fixed time windows, e.g. ttl=86400 -> one entry per (UTC) day -> (start, end)
+    if not local:
+      start = int(ts // ttl * ttl)
+      return start, start + ttl
+    # data bounded by local days (e.g. day-ahead prices): window = whole local days, DST-aware
+    days = max(round(ttl / 86400), 1)
+    day = date.fromtimestamp(ts).toordinal() // days * days
+    midnight = lambda d: int(datetime.combine(date.fromordinal(d), datetime.min.time()).timestamp())
+    return midnight(day), midnight(day + days)
+
+  def entry_file(self, label, key, window):
+    h = hashlib.sha1("|".join([label, str(key), str(window)]).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(self.cache_dir, label + "-" + h + self.FILE_EXT)
+
+  def get(self, label, key, ttl, local=False):
+    if not self.cache_dir:
+      return None
+    ts = time.time()
+    fname = self.entry_file(label, key, self.window(ttl, ts, local)[0])
+    try:
+      with open(fname) as f:
+        entry = json.load(f)
+    except (OSError, ValueError):
+      return None
+    if entry["expires"] < ts:
+      return None
+    return entry["data"]
+
+  def put(self, label, key, ttl, data, local=False):
+    if not self.cache_dir:
+      return
+    ts = time.time()
+    window, expires = self.window(ttl, ts, local)
+    fname = self.entry_file(label, key, window)
+    entry = {"label": label, "window": window, "timestamp": ts, "expires": expires, "data": data}
+    try:
+      os.makedirs(self.cache_dir, exist_ok=True)
+      tmp_fname = fname + ".tmp"
+      with open(tmp_fname, "w") as f:
+        json.dump(entry, f)
+      os.replace(tmp_fname, fname)
+    except OSError as e:
+      print("WARNING: Failed to write provider cache, caching disabled:", e)
+      self.cache_dir = None
+
+  def purge(self):
+    if not os.path.isdir(self.cache_dir):
+      return
+    ts = time.time()
+    for fname in os.listdir(self.cache_dir):
+      if not fname.endswith(self.FILE_EXT):
+        continue
+      fname = os.path.join(self.cache_dir, fname)
+      try:
+        with open(fname) as f:
+          expired = json.load(f)["expires"] < ts
+      except (OSError, ValueError, KeyError):
+        expired = True
+      if expired:
+        try:
+          os.remove(fname)
+        except OSError:
+          pass
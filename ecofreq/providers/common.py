@@ -1,8 +1,13 @@
 import random
+import time
 import os.path
-from _collections import deque
+import urllib.request
+from math import ceil
+from datetime import datetime, timedelta
 
-from ecofreq.config import HOMEDIR
+from ecofreq.config import HOMEDIR, TS_FORMAT, OPTION_DISABLED
+from ecofreq.utils import getbool
+from ecofreq.providers.trace import CO2Trace
 
 class EcoProvider(object):
   LABEL=None
@@ -17,18 +22,45 @@ class EcoProvider(object):
                 "eur/kWh": 100.,
                 "eur/mwh": 0.1,
                 }
+  # lifetime of on-disk cache entries in seconds (0 = provider does not use cache)
+  CACHE_TTL=0
+  # True: cache windows are aligned to local days (e.g. "today" prices), otherwise to UTC
+  CACHE_LOCAL=False
   
   def __init__(self, config, glob_interval):
     if "interval" in config:
       self.interval = int(config["interval"])
     else:
       self.interval = glob_interval
+    # phase offset (sec) relative to the interval grid, e.g. to spread out API calls
+    self.offset = int(config.get("offset", 0)) % self.interval
+    # max age (sec) after which last fetched value is considered stale (0 = never)
+    self.maxage = int(config.get("maxage", 0))
+    self.cache_ttl = int(config.get("cachettl", self.CACHE_TTL))
+    self.cache = None
+    self.recorder = None
+    # True if all I/O is served from a recorded archive (no network, no authentication)
+    self.offline = False
+    # error of the last failed request, if it was handled by the provider itself
+    self.last_error = None
 
   def cfg_string(self):
     return self.LABEL
 
+  @classmethod
+  def error_string(cls, e):
+    return type(e).__name__ + ": " + str(e)
+
+  def set_error(self, e):
+    self.last_error = self.error_string(e)
+
   def info_string(self):
-    return type(self).__name__ + " (interval = " + str(self.interval) + " sec)"
+    s = type(self).__name__ + " (interval = " + str(self.interval) + " sec"
+    if self.offset:
+      s += ", offset = " + str(self.offset) + " sec"
+    if self.maxage:
+      s += ", maxage = " + str(self.maxage) + " sec"
+    return s + ")"
   
   def get_field(self, field, data=None):
     if not data:
@@ -40,6 +72,19 @@ class EcoProvider(object):
     except:   
       return None
 
+  # forecast for [start, end) as a list of (interval_start, interval_end, value), or None if not supported
+  def get_forecast(self, field, start, end):
+    return None
+
+  @classmethod
+  def clip_forecast(cls, records, start, end):
+    # records: iterable of (t1, t2, value) -> clip to [start, end) 
+    forecast = []
+    for t1, t2, val in records:
+      if t2 > start and t1 < end and val is not None:
+        forecast.append((max(t1, start), min(t2, end), val))
+    return sorted(forecast)
+
   def get_co2(self, data=None):
     return self.get_field(self.FIELD_CO2, data)
     
@@ -49,11 +94,87 @@ class EcoProvider(object):
   def get_price(self, data=None):
     return self.get_field(self.FIELD_PRICE, data)
 
+  def now(self):
+    return time.time()
+
+  def http_read(self, req, data=None):
+    resp = urllib.request.urlopen(req, data=data).read()
+    self.record(req.full_url, resp)
+    return resp
+
+  def record(self, url, resp):
+    if self.recorder:
+      self.recorder.record(self.LABEL, url, resp)
+
+  def cache_key(self):
+    return None
+
+  def init_cache(self, cache):
+    self.cache = cache if self.cache_ttl > 0 else None
+    data = self.load_cache()
+    if data:
+      self.cached_data = data
+
+  def load_cache(self):
+    if self.cache:
+      return self.cache.get(self.LABEL, self.cache_key(), self.cache_ttl, self.CACHE_LOCAL)
+    else:
+      return None
+
+  def store_cache(self, data):
+    if self.cache and data:
+      self.cache.put(self.LABEL, self.cache_key(), self.cache_ttl, data, self.CACHE_LOCAL)
+
   def get_config(self):
     cfg = {}
     cfg["interval"] = self.interval
+    if self.offset:
+      cfg["offset"] = self.offset
+    if self.maxage:
+      cfg["maxage"] = self.maxage
+    if self.cache_ttl != self.CACHE_TTL:
+      cfg["cachettl"] = self.cache_ttl
     return cfg
 
+class ProviderBreaker(object):
+  CLOSED="closed"
+  OPEN="open"
+  HALF_OPEN="half-open"
+
+  def __init__(self, config, interval):
+    # number of consecutive failures after which the circuit is opened
+    self.threshold = int(config.get("breakerthreshold", 3))
+    # initial and maximum backoff delay (sec) while the circuit is open
+    self.backoff = int(config.get("backoff", interval))
+    self.max_backoff = int(config.get("maxbackoff", 3600))
+    self.failures = 0
+    self.retry_ts = 0
+    self.last_error = None
+
+  def state(self, ts):
+    if self.failures < self.threshold:
+      return self.CLOSED
+    elif ts < self.retry_ts:
+      return self.OPEN
+    else:
+      return self.HALF_OPEN
+
+  def allow(self, ts):
+    return self.state(ts) != self.OPEN
+
+  def on_success(self, ts):
+    self.failures = 0
+    self.retry_ts = 0
+    self.last_error = None
+
+  def on_failure(self, ts, error):
+    self.failures += 1
+    self.last_error = error
+    if self.failures >= self.threshold:
+      # exponential backoff with jitter
+      delay = min(self.backoff * 2 ** (self.failures - self.threshold), self.max_backoff)
+      self.retry_ts = ts + random.uniform(0.5, 1.0) * delay
+
 class ConstantProvider(EcoProvider):
   LABEL="const"
 
@@ -83,16 +204,27 @@ class ConstantProvider(EcoProvider):
   
 class MockEcoProvider(EcoProvider):
   LABEL="mock"
+  ALIGN_PERIODS = {"exact": 0, "day": 86400, "week": 7 * 86400, "year": None}
+  # sec, allow for a missing last day (e.g. hourly trace ending at Dec 31, 23:00)
+  MIN_YEAR_SPAN = 364 * 86400
   
   def __init__(self, config, glob_interval):
     EcoProvider.__init__(self, config, glob_interval)
     self.co2file = None
+    self.start_ts = time.time()
     self.set_config(config)
 
   def get_config(self):
     cfg = super().get_config()
     cfg["co2range"] = "{0}-{1}".format(self.co2min, self.co2max)
     cfg["co2file"] = self.co2file
+    if self.align:
+      cfg["timealign"] = self.align
+      cfg["interpolate"] = self.interpolate
+    if self.sim_start:
+      cfg["simstart"] = datetime.fromtimestamp(self.sim_start).strftime(TS_FORMAT)
+    if self.sim_speed != 1:
+      cfg["simspeed"] = self.sim_speed
     return cfg
 
   def set_config(self, config):
@@ -102,91 +234,97 @@ class MockEcoProvider(EcoProvider):
     if self.co2file and not os.path.isabs(self.co2file):
       self.co2file = str(HOMEDIR / self.co2file) 
     self.co2min, self.co2max = [int(x) for x in co2range.split("-")]
+    # off = return next trace row on every call, otherwise look up trace row by timestamp
+    self.align = config.get('timealign', 'off').lower()
+    if self.align in OPTION_DISABLED:
+      self.align = None
+    elif self.align not in self.ALIGN_PERIODS:
+      raise ValueError("Unknown trace time alignment: " + self.align)
+    self.interpolate = getbool(config.get('interpolate', False))
+    # simulated clock: start time and speed-up factor
+    sim_start = config.get('simstart', None)
+    self.sim_start = datetime.strptime(sim_start, TS_FORMAT).timestamp() if sim_start else None
+    self.sim_speed = float(config.get('simspeed', 1))
     self.read_co2_file()
+    if self.align and self.trace and not self.trace.has_field(CO2Trace.FIELD_TS):
+      raise ValueError("Trace file has no timestamps, time alignment not possible: " + self.co2file)
+    if self.align == "year" and self.trace and self.trace.rows > 0:
+      # dates outside of the trace would all be clamped to its last row
+      t_first = self.trace.get(CO2Trace.FIELD_TS, 0)
+      t_last = self.trace.get(CO2Trace.FIELD_TS, self.trace.rows - 1)
+      if t_last - t_first < self.MIN_YEAR_SPAN:
+        raise ValueError("Trace file spans less than a year, use TimeAlign=exact/day/week instead: " + self.co2file)
 
   def read_co2_file(self):
     if self.co2file:
       if not os.path.isfile(self.co2file):
         raise ValueError("File not found: " + self.co2file)
-      self.co2queue = deque()
-      self.fossil_queue = deque()
-      self.price_queue = deque()
-      self.index_queue = deque()
-      co2_field = 0
-      fossil_field = 1
-      index_field = -1
-      with open(self.co2file) as f:
-        for line in f:
-          if line.startswith("##"):
-            pass
-          elif line.startswith("#"):
-            toks = [x.strip() for x in line.replace("#", "", 1).split("\t")]
-            try:
-              co2_field = toks.index('CI [g/kWh]')
-            except ValueError:
-              co2_field = toks.index('gCO2/kWh')
-            try:
-              fossil_field = toks.index('Fossil [%]')
-            except ValueError:
-              fossil_field = -1
-            if 'Price/kWh' in toks:
-              price_field = toks.index('Price/kWh')
-              price_factor = 1
-            elif 'EUR/MWh'in toks:
-              price_field = toks.index('EUR/MWh')
-              price_factor = 0.1
-            else:
-              price_field = -1
-            if 'co2index' in toks:  
-              index_field = toks.index('co2index')
-            elif 'Index' in toks:
-              index_field = toks.index('Index')
-          else:  
-            toks = line.split("\t")
-            co2 = None if toks[co2_field].strip() == "NA" else float(toks[co2_field])
-            self.co2queue.append(co2)
-            if fossil_field >= 0 and fossil_field < len(toks):
-              fossil_pct = None if toks[fossil_field].strip() == "NA" else float(toks[fossil_field])
-              self.fossil_queue.append(fossil_pct)
-            if price_field >= 0 and price_field < len(toks):
-              price_kwh = None if toks[price_field].strip() == "NA" else float(toks[price_field]) * price_factor
-              self.price_queue.append(price_kwh)
-            if index_field >= 0 and index_field < len(toks):
-              index = None if toks[index_field].strip() == "NA" else toks[index_field].strip()
-              self.index_queue.append(index)
+      self.trace = CO2Trace.load(self.co2file)
+      self.trace_pos = 0
     else:
-      self.co2queue = None
-      self.fossil_queue = None
-      self.price_queue = None
-      self.index_queue = None
+      self.trace = None
       
+  def now(self):
+    sim_start = self.sim_start or self.start_ts
+    return sim_start + (time.time() - self.start_ts) * self.sim_speed
+
+  def trace_time(self, ts):
+    # map (simulated) time to the trace time range, preserving time of day/week/year
+    t_first = self.trace.get(CO2Trace.FIELD_TS, 0)
+    t_last = self.trace.get(CO2Trace.FIELD_TS, self.trace.rows - 1)
+    if self.align == "exact" and t_first <= ts <= t_last:
+      return ts
+    elif self.align == "year":
+      d = datetime.fromtimestamp(ts)
+      y_first = datetime.fromtimestamp(t_first).year
+      y_last = datetime.fromtimestamp(t_last).year
+      y = y_first + (d.year - y_first) % (y_last - y_first + 1)
+      try:
+        d = d.replace(year=y)
+      except ValueError:
+        # Feb 29
+        d = d.replace(year=y, day=28)
+      return d.timestamp()
+    else:
+      period = self.ALIGN_PERIODS[self.align]
+      if period:
+        d_first = datetime.fromtimestamp(t_first).replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.align == "week":
+          d_first -= timedelta(days=d_first.weekday())
+        base = d_first.timestamp()
+        span = ceil((t_last - base + 1) / period) * period
+      else:
+        base = t_first
+        step = self.trace.get(CO2Trace.FIELD_TS, 1) - t_first if self.trace.rows > 1 else 1
+        span = t_last - t_first + step
+      return base + (ts - base) % span
+
   def get_data(self):
-    if self.co2queue and len(self.co2queue) > 0:
-      co2 = self.co2queue.popleft()
-      self.co2queue.append(co2)
-      fossil_pct = None
+    fossil_pct = None
+    price_kwh = None
+    index = None
+    if self.trace and self.trace.rows > 0 and self.align:
+      ts = self.trace_time(self.now())
+      co2 = self.trace.get_at(CO2Trace.FIELD_CO2, ts, self.interpolate)
+      if self.trace.has_field(CO2Trace.FIELD_FOSSIL_PCT):
+        fossil_pct = self.trace.get_at(CO2Trace.FIELD_FOSSIL_PCT, ts, self.interpolate)
+      price_kwh = self.trace.get_at(CO2Trace.FIELD_PRICE, ts, self.interpolate)
+      index = self.trace.get_index(self.trace.find(ts))
+    elif self.trace and self.trace.rows > 0:
+      i = self.trace_pos
+      self.trace_pos = (i + 1) % self.trace.rows
+      co2 = self.trace.get(CO2Trace.FIELD_CO2, i)
+      if self.trace.has_field(CO2Trace.FIELD_FOSSIL_PCT):
+        fossil_pct = self.trace.get(CO2Trace.FIELD_FOSSIL_PCT, i)
+      price_kwh = self.trace.get(CO2Trace.FIELD_PRICE, i)
+      index = self.trace.get_index(i)
     else: 
       co2 = random.randint(self.co2min, self.co2max)
       
-    if self.fossil_queue and len(self.fossil_queue) > 0:
-      fossil_pct = self.fossil_queue.popleft()
-      self.fossil_queue.append(fossil_pct)
-    elif co2:
+    if co2 and not (self.trace and self.trace.has_field(CO2Trace.FIELD_FOSSIL_PCT)):
       fossil_pct = (co2 - self.co2min) / (self.co2max - self.co2min)
       fossil_pct = min(max(fossil_pct, 0), 1) * 100
 
-    if self.price_queue and len(self.price_queue) > 0:
-      price_kwh = self.price_queue.popleft()
-      self.price_queue.append(price_kwh)
-    else:
-      price_kwh = None
-
-    if self.index_queue and len(self.index_queue) > 0:
-      index = self.index_queue.popleft()
-      self.index_queue.append(index)
-    else:
-      index = None
-      
     data = {}
     data[self.FIELD_CO2] = co2
     data[self.FIELD_FOSSIL_PCT] = fossil_pct
@@ -1,6 +1,13 @@
+import sys
+import time
+from math import gcd
+
 from ecofreq.providers.common import *
 from ecofreq.providers.mqtt import *
 from ecofreq.providers.rest import *
+from ecofreq.providers.cache import ProviderCache
+from ecofreq.providers.archive import ProviderRecorder, ReplayProvider
+from ecofreq.providers.tariff import TariffProvider
 
 class EcoProviderManager(object):
   PROV_DICT = {"co2signal" : CO2Signal, 
@@ -13,6 +20,7 @@ class EcoProviderManager(object):
                "tibber": TibberProvider, 
                "octopus": OctopusProvider, 
                "awattar": AwattarProvider, 
+               "tariff": TariffProvider, 
                "mqtt": MQTTEcoProvider,
                "mock" : MockEcoProvider, 
                "const": ConstantProvider }
@@ -20,6 +28,10 @@ class EcoProviderManager(object):
   def __init__(self, config):
     self.init_prov_dict()
     self.providers = {}
+    self.fallbacks = {}
+    self.last_data = {}
+    self.last_update = {}
+    self.last_source = {}
     self.set_config(config)
     
   def init_prov_dict(self):
@@ -34,28 +46,69 @@ class EcoProviderManager(object):
     else:
       return "None"
 
+  def create_provider(self, config, metric, p):
+    if p.startswith("const:"):
+      cfg = { metric: p.strip("const:") }
+      prov = ConstantProvider(cfg, self.interval)
+    elif p.startswith("mqtt"):
+      cfg = config[p]
+      prov = MQTTEcoProvider(cfg, self.interval, p)
+    elif p == ReplayProvider.LABEL:
+      cfg = config[p]
+      label = cfg["provider"]
+      if label not in self.prov_dict:
+        raise ValueError("Unknown emission provider: " + label)
+      inner_cfg = config[label] if label in config else {}
+      prov = ReplayProvider(cfg, self.interval, self.prov_dict[label](inner_cfg, self.interval))
+#    elif p in self.PROV_DICT:
+    elif p in self.prov_dict:
+      try: 
+        cfg = config[p]
+      except KeyError:
+        cfg = {}
+      prov = self.prov_dict[p](cfg, self.interval)  
+    else:
+      raise ValueError("Unknown emission provider: " + p)
+    prov.init_cache(self.cache)
+    prov.recorder = self.recorder
+    prov.breaker = ProviderBreaker(config["provider"], prov.interval)
+    return prov
+
   def set_config(self, config):
     self.interval = int(config["provider"]["interval"])
+    self.monitor_interval = int(config["monitor"]["interval"])
+    self.cache = ProviderCache.from_config(config)
+    self.recorder = ProviderRecorder.from_config(config)
     for metric in ["all", EcoProvider.FIELD_CO2, EcoProvider.FIELD_PRICE, EcoProvider.FIELD_INDEX, EcoProvider.FIELD_FOSSIL_PCT]:
       if metric in config["provider"]:
         p = config["provider"].get(metric)
         if p in [None, "", "none", "off"]:
           self.providers.pop(metric, None)
-        elif p.startswith("const:"):
-          cfg = { metric: p.strip("const:") }
-          self.providers[metric] = ConstantProvider(cfg, self.interval)
-        elif p.startswith("mqtt"):
-          cfg = config[p]
-          self.providers[metric] = MQTTEcoProvider(cfg, self.interval, p)
-#        elif p in self.PROV_DICT:
-        elif p in self.prov_dict:
-          try: 
-            cfg = config[p]
-          except KeyError:
-            cfg = {}
-          self.providers[metric] = self.prov_dict[p](cfg, self.interval)  
+          self.fallbacks.pop(metric, None)
         else:
-          raise ValueError("Unknown emission provider: " + p)
+          self.providers[metric] = self.create_provider(config, metric, p)
+          self.align_offset(self.providers[metric])
+          # fallback chain, e.g. co2_fallback=co2signal,const:300
+          fb_list = config["provider"].get(metric + "_fallback", None)
+          if fb_list:
+            self.fallbacks[metric] = [self.create_provider(config, metric, fb.strip()) for fb in fb_list.split(",")]
+          else:
+            self.fallbacks.pop(metric, None)
+    self.tick = self.get_tick()
+
+  def align_offset(self, p):
+    # providers are polled on the monitor interval grid -> other offsets would never be due
+    offset = round(p.offset / self.monitor_interval) * self.monitor_interval % p.interval
+    if offset != p.offset:
+      print("WARNING: Provider offset must be a multiple of monitor interval, using:", offset)
+      p.offset = offset
+
+  def get_tick(self):
+    # greatest common divisor of all provider intervals -> scheduling granularity
+    tick = self.interval
+    for p in self.providers.values():
+      tick = gcd(tick, p.interval)
+    return tick
 
   def get_config(self, config={}):
     config["provider"] = {}
@@ -66,12 +119,97 @@ class EcoProviderManager(object):
       config[p.LABEL] = p.get_config()
     return config
 
+  def is_due(self, metric, duration):
+    p = self.providers[metric]
+    return duration % p.interval == p.offset
+
+  def is_stale(self, metric, ts):
+    if metric not in self.last_update:
+      return True
+    p = self.providers[metric]
+    return p.maxage > 0 and ts - self.last_update[metric] > p.maxage
+
+  def poll(self, p, metric, ts):
+    if not p.breaker.allow(ts):
+      return None
+    p.last_error = None
+    try:
+      if metric == "all":
+        data = p.get_data()
+        data = dict(data) if data else None
+      else:
+        val = p.get_field(metric)
+        data = {metric: val} if val is not None else None
+      error = p.last_error or "No data"
+    except Exception as e:
+      print ("Exception: ", sys.exc_info())
+      data = None
+      error = p.error_string(e)
+    if data:
+      p.breaker.on_success(ts)
+    else:
+      p.breaker.on_failure(ts, error)
+    return data
+
+  def fetch(self, metric):
+    ts = time.time()
+    p = self.providers[metric]
+    sources = [p]
+    # primary provider failed or is blocked by breaker -> switch to fallback chain, 
+    # unless the last good value from primary is still fresh (maxage)
+    primary_fresh = self.last_source.get(metric) is p and p.maxage > 0 and not self.is_stale(metric, ts)
+    if not primary_fresh:
+      sources += self.fallbacks.get(metric, [])
+    for src in sources:
+      data = self.poll(src, metric, ts)
+      if data:
+        self.last_data[metric] = data
+        self.last_update[metric] = ts
+        self.last_source[metric] = src
+        return True
+    return False
+
+  def update(self, duration=None):
+    # poll providers which are due at this point in time (or all of them if duration is None)
+    updated = False
+    for metric in self.providers.keys():
+      if duration is None or self.is_due(metric, duration):
+        updated = self.fetch(metric) or updated
+    return updated
+
+  def get_status(self):
+    ts = time.time()
+    status = {}
+    for metric, p in self.providers.items():
+      src = self.last_source.get(metric, None)
+      s = {}
+      s["provider"] = p.cfg_string()
+      s["state"] = p.breaker.state(ts)
+      s["failures"] = p.breaker.failures
+      s["last_error"] = p.breaker.last_error
+      s["retry_in"] = max(round(p.breaker.retry_ts - ts), 0)
+      s["source"] = src.cfg_string() if src else None
+      s["age"] = round(ts - self.last_update[metric]) if metric in self.last_update else None
+      s["stale"] = self.is_stale(metric, ts)
+      status[metric] = s
+    return status
+
+  def get_forecast(self, metric, start, end):
+    for m in [metric, "all"]:
+      if m in self.providers:
+        return self.last_source.get(m, self.providers[m]).get_forecast(metric, start, end)
+    return None
+
   def get_data(self):
     data = {}
-    if "all" in self.providers:
-      data = self.providers["all"].get_data()
+    ts = time.time()
+    if "all" in self.providers and not self.is_stale("all", ts):
+      data.update(self.last_data["all"])
     for metric in self.providers.keys():
       if metric != "all":
-        data[metric] = self.providers[metric].get_field(metric)
+        if self.is_stale(metric, ts):
+          data[metric] = None
+        else:
+          data[metric] = self.last_data[metric][metric]
     return data
   
@@ -6,6 +6,7 @@ import urllib.request
 import requests
 from requests.auth import HTTPBasicAuth
 import json
+import hashlib
 
 from ecofreq.utils import getbool
 from ecofreq.helpers.geo import GeoHelper
@@ -63,15 +64,9 @@ class CO2Signal(EcoProvider):
     req.add_header("User-Agent", "Mozilla/5.0 (X11; U; Linux i686) Gecko/20071127 Firefox/2.0.0.11")
     req.add_header("auth-token", self.co2token)
 
-    try:
-      resp = urllib.request.urlopen(req).read()
-      js = json.loads(resp)
-      data = self.remap(js['data'])
-    except:
-      e = sys.exc_info()[0]
-      print ("Exception: ", e)
-      data = None
-    return data
+    resp = self.http_read(req)
+    js = json.loads(resp)
+    return self.remap(js['data'])
 
 class ElectricityMapsProvider(EcoProvider):
   LABEL="electricitymaps"
@@ -117,14 +112,17 @@ class ElectricityMapsProvider(EcoProvider):
     self.update_url()
 
   def remap(self, jsco2, jsmix):
+    if not jsco2:
+      return None
     data = {}
     for k, v in self.FIELD_MAP.items():
       if v in jsco2:
         data[k] = jsco2[v]
-      elif v in jsmix:
+      elif jsmix and v in jsmix:
         data[k] = jsmix[v]
         
-    data[EcoProvider.FIELD_FOSSIL_PCT] = 100 - jsmix["fossilFreePercentage"]      
+    if jsmix:
+      data[EcoProvider.FIELD_FOSSIL_PCT] = 100 - jsmix["fossilFreePercentage"]      
         
     return data
 
@@ -146,12 +144,12 @@ class ElectricityMapsProvider(EcoProvider):
       req.add_header("auth-token", self.token)
 
     try:
-      resp = urllib.request.urlopen(req).read()
+      resp = self.http_read(req)
       js = json.loads(resp)
       return js
-    except:
-      e = sys.exc_info()
+    except Exception as e:
       print ("Exception: ", e)
+      self.set_error(e)
       return None
 
   def get_data(self):
@@ -218,15 +216,9 @@ class UKGridProvider(EcoProvider):
     req.add_header("User-Agent", "Mozilla/5.0 (X11; U; Linux i686) Gecko/20071127 Firefox/2.0.0.11")
     req.add_header("Accept", "application/json")
 
-    try:
-      resp = urllib.request.urlopen(req).read()
-      js = json.loads(resp)
-      data = self.remap(js['data'])
-    except:
-      e = sys.exc_info()
-      print ("Exception: ", e)
-      data = None
-    return data
+    resp = self.http_read(req)
+    js = json.loads(resp)
+    return self.remap(js['data'])
 
 class StromGedachtProvider(EcoProvider):
   LABEL="stromgedacht"
@@ -249,6 +241,7 @@ class StromGedachtProvider(EcoProvider):
   def set_config(self, config):
     self.postcode = config.get("postcode", 70173)
     self.intstates = config.get("integerstates", False)
+    self.last_forecast = None
     self.update_url()
 
   def get_val_now(self, ts, arr):
@@ -263,21 +256,41 @@ class StromGedachtProvider(EcoProvider):
         last_val = int(e["value"])
     return None
 
+  def fossil_pct(self, load, residualLoad, superGreenThreshold):
+    return 100. * (residualLoad - superGreenThreshold) / load
+
   def remap(self, jsnow, jsforecast):
+    if not jsnow or not jsforecast:
+      return None
     data = {}
     s = jsnow["state"]
     data[EcoProvider.FIELD_INDEX] = s if self.intstates else self.STATE_MAP[s]
       
-    ts = datetime.utcnow()
+    ts = datetime.utcfromtimestamp(self.now())
     load = self.get_val_now(ts, jsforecast["load"])
     renewableEnergy = self.get_val_now(ts, jsforecast["renewableEnergy"])
     residualLoad = self.get_val_now(ts, jsforecast["residualLoad"])
     superGreenThreshold = self.get_val_now(ts, jsforecast["superGreenThreshold"])
       
 #    print(load, renewableEnergy, residualLoad, superGreenThreshold)
-    data[EcoProvider.FIELD_FOSSIL_PCT] = 100. * (residualLoad - superGreenThreshold) / load
+    data[EcoProvider.FIELD_FOSSIL_PCT] = self.fossil_pct(load, residualLoad, superGreenThreshold)
     return data
 
+  def get_forecast(self, field, start, end):
+    js = self.last_forecast
+    if field != EcoProvider.FIELD_FOSSIL_PCT or not js:
+      return None
+    records = []
+    vals = zip(js["load"], js["residualLoad"], js["superGreenThreshold"])
+    last_ts = last_val = None
+    for load, residual, threshold in vals:
+      t = datetime.fromisoformat(load["dateTime"].replace('Z', '+00:00')).timestamp()
+      if last_ts:
+        records.append((last_ts, t, last_val))
+      last_ts = t
+      last_val = self.fossil_pct(int(load["value"]), int(residual["value"]), int(threshold["value"]))
+    return self.clip_forecast(records, start, end)
+
   def update_url(self):
     self.api_url_now = self.URL_NOW.format(self.postcode)
     self.api_url_forecast = self.URL_FORECAST.format(self.postcode)
@@ -288,17 +301,19 @@ class StromGedachtProvider(EcoProvider):
     req.add_header("Accept", "application/json")
 
     try:
-      resp = urllib.request.urlopen(req).read()
+      resp = self.http_read(req)
       js = json.loads(resp)
       return js
-    except:
-      e = sys.exc_info()
+    except Exception as e:
       print ("Exception: ", e)
+      self.set_error(e)
       return None
 
   def get_data(self):
     jsnow = self.fetch_json(self.api_url_now)
     jsforecast = self.fetch_json(self.api_url_forecast)
+    if jsforecast:
+      self.last_forecast = jsforecast
     data = self.remap(jsnow, jsforecast)
     return data 
 
@@ -332,6 +347,7 @@ class EnergyChartsProvider(EcoProvider):
     self.postcode = config.get("postcode", None)
     self.pricezone = config.get("pricezone", None)
     self.intstates = config.get("integerstates", False)
+    self.last_signal = self.last_price = None
     self.update_url()
 
   def get_val_now_idx(self, ts, arr):
@@ -348,7 +364,7 @@ class EnergyChartsProvider(EcoProvider):
   def remap(self, jssignal, jsprice):
     data = {}
     
-    ts = int(time.time())
+    ts = int(self.now())
 
     if jssignal:
       idx = self.get_val_now_idx(ts, jssignal["unix_seconds"])
@@ -358,15 +374,37 @@ class EnergyChartsProvider(EcoProvider):
       
     if jsprice:
       idx = self.get_val_now_idx(ts, jsprice["unix_seconds"])
-      p = float(jsprice["price"][idx])
-      if 'unit' in jsprice:
-        unit = jsprice['unit'].lower()
-        p *= EcoProvider.PRICE_UNITS.get(unit, 1)    
-      data[EcoProvider.FIELD_PRICE] = p   
+      data[EcoProvider.FIELD_PRICE] = self.price_val(jsprice, idx)
 
 #    print(data)
     return data
 
+  def price_val(self, jsprice, idx):
+    p = float(jsprice["price"][idx])
+    if 'unit' in jsprice:
+      unit = jsprice['unit'].lower()
+      p *= EcoProvider.PRICE_UNITS.get(unit, 1)    
+    return p
+
+  def get_forecast(self, field, start, end):
+    if field == EcoProvider.FIELD_PRICE and self.last_price:
+      js = self.last_price
+      vals = [self.price_val(js, i) for i in range(len(js["price"]))]
+    elif field in [EcoProvider.FIELD_INDEX, EcoProvider.FIELD_REN_PCT] and self.last_signal:
+      js = self.last_signal
+      if field == EcoProvider.FIELD_REN_PCT:
+        vals = js["share"]
+      else:
+        vals = [int(s) if self.intstates else self.STATE_MAP[int(s)] for s in js["signal"]]
+    else:
+      return None
+    ts = js["unix_seconds"]
+    if len(ts) < 2:
+      return None
+    # last interval is assumed to be as long as the previous one
+    ts_end = ts[1:] + [2 * ts[-1] - ts[-2]]
+    return self.clip_forecast(zip(ts, ts_end, vals), start, end)
+
   def update_url(self):
     self.api_url_signal = self.URL_SIGNAL.format(self.country)
     if self.postcode:
@@ -382,18 +420,18 @@ class EnergyChartsProvider(EcoProvider):
     req.add_header("Accept", "application/json")
 
     try:
-      resp = urllib.request.urlopen(req).read()
+      resp = self.http_read(req)
       js = json.loads(resp)
       return js
-    except:
-      e = sys.exc_info()
+    except Exception as e:
       print ("Exception: ", e)
+      self.set_error(e)
       return None
 
   def get_data(self):
     jssignal = self.fetch_json(self.api_url_signal)
     if self.api_url_price:
-      ts = time.time()
+      ts = self.now()
       tsdelta = 4*3600 
       fmt = '%Y-%m-%dT%H:%M'
       start = datetime.utcfromtimestamp(ts-tsdelta).strftime(fmt) 
@@ -402,6 +440,8 @@ class EnergyChartsProvider(EcoProvider):
       jsprice = self.fetch_json(url)
     else:
       jsprice = None
+    self.last_signal = jssignal or self.last_signal
+    self.last_price = jsprice or self.last_price
     data = self.remap(jssignal, jsprice)
     return data 
 
@@ -416,6 +456,7 @@ class GridStatusIOProvider(EcoProvider):
   URL_PERIOD = "?start_time={}"
   URL_LATEST = URL_QUERY.format("isos_latest") + URL_ISO
   URL_FORECAST = URL_QUERY + URL_LOCATION + URL_PERIOD
+  CACHE_TTL = 86400
   
   def __init__(self, config, glob_interval):
     EcoProvider.__init__(self, config, glob_interval)
@@ -443,18 +484,19 @@ class GridStatusIOProvider(EcoProvider):
     self.dataset = config.get("dataset", def_dataset)
     self.update_url()
 
+  def cache_key(self):
+    return (self.iso, self.location, self.dataset)
+
   def remap(self, jslatest, jsforecast):
     data = {}
     
-    ts = time.time()
+    ts = self.now()
 
     if jslatest:
       p = float(jslatest[0]["latest_lmp"])
     elif jsforecast:
       tsrec = None
-      for jsrec in jsforecast:
-        t1 = datetime.fromisoformat(jsrec["interval_start_utc"]).timestamp()
-        t2 = datetime.fromisoformat(jsrec["interval_end_utc"]).timestamp()
+      for t1, t2, jsrec in self.forecast_records(jsforecast):
         if ts >= t1 and  ts <= t2: 
           tsrec = jsrec
           break
@@ -470,6 +512,19 @@ class GridStatusIOProvider(EcoProvider):
 
     return data
 
+  def forecast_records(self, jsforecast):
+    for jsrec in jsforecast:
+      t1 = datetime.fromisoformat(jsrec["interval_start_utc"]).timestamp()
+      t2 = datetime.fromisoformat(jsrec["interval_end_utc"]).timestamp()
+      yield t1, t2, jsrec
+
+  def get_forecast(self, field, start, end):
+    if field != EcoProvider.FIELD_PRICE or not self.cached_data:
+      return None
+    ufactor = EcoProvider.PRICE_UNITS.get(self.PRICE_UNIT, 1)
+    records = [(t1, t2, float(jsrec[self.price_field]) * ufactor) for t1, t2, jsrec in self.forecast_records(self.cached_data)]
+    return self.clip_forecast(records, start, end)
+
   def update_url(self):
     self.api_url_latest = self.URL_LATEST.format(self.iso)
     if self.location:
@@ -485,22 +540,23 @@ class GridStatusIOProvider(EcoProvider):
       req.add_header("x-api-key", self.token)
 
     try:
-      resp = urllib.request.urlopen(req).read()
+      resp = self.http_read(req)
       js = json.loads(resp)
       return js
-    except:
-      e = sys.exc_info()
+    except Exception as e:
       print ("Exception: ", e)
+      self.set_error(e)
       return None
 
   def get_data(self):
     if self.api_url_forecast:
       data = self.remap(None, self.cached_data)
       if not data:
-        tnow = datetime.utcnow().replace(minute=0, second=0).strftime(self.TIME_FORMAT)
+        tnow = datetime.utcfromtimestamp(self.now()).replace(minute=0, second=0).strftime(self.TIME_FORMAT)
         url = self.api_url_forecast.format(tnow)
         jsforecast = self.fetch_json(url)
         self.cached_data = jsforecast['data']
+        self.store_cache(self.cached_data)
         data = self.remap(None, self.cached_data)
     else:      
       jslatest = self.fetch_json(self.api_url_latest)
@@ -514,15 +570,23 @@ class WattTimeProvider(EcoProvider):
   URL_INDEX = URL_BASE + "v3/signal-index"
   URL_FORECAST = URL_BASE + "v3/forecast"
   LB_TO_KG = 0.45359237
+  # WattTime tokens expire after 30 min, renew them a bit earlier
+  TOKEN_TTL = 1800
+  TOKEN_RENEW = 60
   
   def __init__(self, config, glob_interval):
     EcoProvider.__init__(self, config, glob_interval)
+    self.session = requests.Session()
+    self.token = None
+    self.token_expires = 0
     self.set_config(config)
     
   def get_config(self):
     cfg = super().get_config()
     if self.region:
       cfg["region"] = self.region
+    if self.forecast_hours:
+      cfg["forecasthours"] = self.forecast_hours
     return cfg
 
   def set_config(self, config):
@@ -532,6 +596,9 @@ class WattTimeProvider(EcoProvider):
     self.signal_type = config.get("signaltype", "co2_moer")
     self.use_index = getbool(config.get("useindex", True))
     self.use_forecast = getbool(config.get("useforecast", True))
+    self.forecast_hours = int(config.get("forecasthours", 0))
+    self.last_forecast = None
+    self.token_ttl = int(config.get("tokenttl", self.TOKEN_TTL))
     
     if not self.region:
       print ("ERROR: WattTime: region code is missing!")
@@ -540,8 +607,31 @@ class WattTimeProvider(EcoProvider):
     self.update_url()
 
   def login(self):
-    rsp = requests.get(self.URL_LOGIN, auth=HTTPBasicAuth(self.username, self.password))
+    rsp = self.session.get(self.URL_LOGIN, auth=HTTPBasicAuth(self.username, self.password))
+    rsp.raise_for_status()
     self.token = rsp.json()['token']
+    self.token_expires = time.time() + self.token_ttl
+    self.session.headers.update({'Authorization': 'Bearer {}'.format(self.token)})
+
+  def check_login(self):
+    # replay: login response is not recorded (it contains the token), and not needed anyway
+    if self.offline:
+      return
+    if not self.token or time.time() >= self.token_expires - self.TOKEN_RENEW:
+      self.login()
+
+  def query(self, url, params):
+    self.check_login()
+    return json.loads(self.session_read(url, params))
+
+  def session_read(self, url, params):
+    rsp = self.session.get(url, params=params)
+    if rsp.status_code == 401:
+      # token revoked or expired prematurely -> login again and retry once
+      self.login()
+      rsp = self.session.get(url, params=params)
+    self.record(rsp.url, rsp.content)
+    return rsp.content
 
   def remap(self, jsdict, data={}):
     jsdata = jsdict["data"]
@@ -555,32 +645,34 @@ class WattTimeProvider(EcoProvider):
 #    print(data)
     return data
 
+  def get_forecast(self, field, start, end):
+    js = self.last_forecast
+    if field != EcoProvider.FIELD_CO2 or not js or js["meta"]["units"] != "lbs_co2_per_mwh":
+      return None
+    period = int(js["meta"].get("data_point_period_seconds", 300))
+    records = []
+    for rec in js["data"]:
+      t = datetime.fromisoformat(rec["point_time"].replace('Z', '+00:00')).timestamp()
+      records.append((t, t + period, float(rec["value"]) * self.LB_TO_KG))
+    return self.clip_forecast(records, start, end)
+
   def update_url(self):
     self.api_url_index = self.URL_INDEX if self.use_index else None
     self.api_url_forecast = self.URL_FORECAST if self.use_forecast else None
 
   def get_data(self):
-    self.login()
-    headers = {'Authorization': 'Bearer {}'.format(self.token)}
     params = {'region': self.region, 'signal_type': self.signal_type}
-    try:
-      data = {}
-      if self.api_url_index: 
-        rsp = requests.get(self.api_url_index, headers=headers, params=params)
-        js = rsp.json()
-#        print(js)
-        self.remap(js, data)
-      if self.api_url_forecast: 
-        params["horizon_hours"] = 0
-        rsp = requests.get(self.api_url_forecast, headers=headers, params=params)
-        js = rsp.json()
-#        print(js)
-        self.remap(js, data)
-    except:
-      e = sys.exc_info()
-      print ("Exception: ", e)
-      data = None
-      
+    data = {}
+    if self.api_url_index: 
+      js = self.query(self.api_url_index, params)
+#      print(js)
+      self.remap(js, data)
+    if self.api_url_forecast: 
+      params["horizon_hours"] = self.forecast_hours
+      js = self.query(self.api_url_forecast, params)
+#      print(js)
+      self.remap(js, data)
+      self.last_forecast = js
     return data
 
 class TibberProvider(EcoProvider):
@@ -588,6 +680,9 @@ class TibberProvider(EcoProvider):
   URL_BASE="https://api.tibber.com/v1-beta/gql"
   QUERY_PRICE='{ "query": "{viewer {homes {currentSubscription {priceInfo {%period% {total energy tax startsAt }}}}}}" }'
   FIELD_MAP = {EcoProvider.FIELD_PRICE: "total", EcoProvider.FIELD_TAX: "tax"}
+  CACHE_TTL = 86400
+  # prices are published per local day
+  CACHE_LOCAL = True
 
   def __init__(self, config, glob_interval):
     EcoProvider.__init__(self, config, glob_interval)
@@ -602,10 +697,19 @@ class TibberProvider(EcoProvider):
 
   def set_config(self, config):
     self.token = config.get("token", None)
-    self.use_cache = config.get("usecache", False)
+    self.use_cache = getbool(config.get("usecache", False))
     self.query_period = "today" if self.use_cache else "current"
     self.api_url = self.URL_BASE
     self.query = self.QUERY_PRICE.replace("%period%", self.query_period)
+
+  def cache_key(self):
+    # do not leak API token into cache file 
+    return hashlib.sha1(str(self.token).encode("utf-8")).hexdigest()
+
+  def init_cache(self, cache):
+    # "current" price is never served from cache
+    if self.use_cache:
+      super().init_cache(cache)
     
   def remap(self, jsdata):
     if not jsdata:
@@ -613,13 +717,12 @@ class TibberProvider(EcoProvider):
     data = {}
 #    print(jsdata)
     jsprice = jsdata["viewer"]["homes"][0]["currentSubscription"]["priceInfo"][self.query_period] 
-    ts = time.time()
+    ts = self.now()
 #    print(ts)
     if self.use_cache:
       tsrec = None
-      for jsrec in jsprice:
-        t =  datetime.fromisoformat(jsrec["startsAt"]).timestamp()
-        if ts >= t and  ts <= t + 3600: 
+      for t1, t2, jsrec in self.forecast_records(jsprice):
+        if ts >= t1 and  ts <= t2: 
           tsrec = jsrec
           break
     else:
@@ -632,6 +735,19 @@ class TibberProvider(EcoProvider):
 #    print(data)
     return data
 
+  def forecast_records(self, jsprice):
+    for jsrec in jsprice:
+      t =  datetime.fromisoformat(jsrec["startsAt"]).timestamp()
+      yield t, t + 3600, jsrec
+
+  def get_forecast(self, field, start, end):
+    # only "today" prices are available in cache mode
+    if not self.use_cache or not self.cached_data or field not in self.FIELD_MAP:
+      return None
+    jsprice = self.cached_data["viewer"]["homes"][0]["currentSubscription"]["priceInfo"][self.query_period]
+    records = [(t1, t2, jsrec[self.FIELD_MAP[field]]) for t1, t2, jsrec in self.forecast_records(jsprice)]
+    return self.clip_forecast(records, start, end)
+
   def fetch_data(self):
     req = urllib.request.Request(self.api_url)
     req.add_header("User-Agent", "Mozilla/5.0 (X11; U; Linux i686) Gecko/20071127 Firefox/2.0.0.11")
@@ -640,13 +756,14 @@ class TibberProvider(EcoProvider):
       req.add_header("Authorization", self.token)
 
     try:
-      resp = urllib.request.urlopen(req, data=self.query.encode("utf-8")).read()
+      resp = self.http_read(req, data=self.query.encode("utf-8"))
       js = json.loads(resp)
 #      print(js)
       self.cached_data = js['data']
-    except:
-      e = sys.exc_info()
+      self.store_cache(self.cached_data)
+    except Exception as e:
       print ("Exception: ", e)
+      self.set_error(e)
       data = None
 
   def get_data(self):
@@ -666,6 +783,7 @@ class OctopusProvider(EcoProvider):
   URL_TARRIF=URL_PRODUCT+"/electricity-tariffs/{}"
   URL_PRICE=URL_TARRIF+"/standard-unit-rates"
   FIELD_MAP = {EcoProvider.FIELD_PRICE: "value_inc_vat"}
+  CACHE_TTL = 86400
 
   def __init__(self, config, glob_interval):
     EcoProvider.__init__(self, config, glob_interval)
@@ -684,11 +802,18 @@ class OctopusProvider(EcoProvider):
     self.token = config.get("token", None)
     self.product = config.get("product", None)
     self.tariff = config.get("tariff", None)
-    self.use_cache = config.get("usecache", True)
+    self.use_cache = getbool(config.get("usecache", True))
     self.update_url()
     
   def update_url(self):
     self.api_url = self.URL_PRICE.format(self.product, self.tariff)
+
+  def cache_key(self):
+    return (self.product, self.tariff)
+
+  def init_cache(self, cache):
+    if self.use_cache:
+      super().init_cache(cache)
     
   def remap(self, jsdata):
     if not jsdata:
@@ -696,12 +821,10 @@ class OctopusProvider(EcoProvider):
     data = {}
 #    print(jsdata)
     jsprice = jsdata["results"] 
-    ts = datetime.utcnow()
+    ts = self.now()
 #    print(ts)
     tsrec = None
-    for jsrec in jsprice:
-      ts_from = datetime.fromisoformat(jsrec["valid_from"].replace('Z', '' ))
-      ts_to = datetime.fromisoformat(jsrec["valid_to"].replace('Z', '' ))
+    for ts_from, ts_to, jsrec in self.forecast_records(jsprice):
       if ts >= ts_from and  ts <= ts_to: 
         tsrec = jsrec
         break
@@ -713,6 +836,19 @@ class OctopusProvider(EcoProvider):
 #    print(data)
     return data
 
+  def forecast_records(self, jsprice):
+    for jsrec in jsprice:
+      ts_from = datetime.fromisoformat(jsrec["valid_from"].replace('Z', '+00:00')).timestamp()
+      # open-ended rate
+      ts_to = datetime.fromisoformat(jsrec["valid_to"].replace('Z', '+00:00')).timestamp() if jsrec["valid_to"] else float("inf")
+      yield ts_from, ts_to, jsrec
+
+  def get_forecast(self, field, start, end):
+    if not self.cached_data or field not in self.FIELD_MAP:
+      return None
+    records = [(t1, t2, jsrec[self.FIELD_MAP[field]]) for t1, t2, jsrec in self.forecast_records(self.cached_data["results"])]
+    return self.clip_forecast(records, start, end)
+
   def fetch_data(self):
     req = urllib.request.Request(self.api_url)
     req.add_header("User-Agent", "Mozilla/5.0 (X11; U; Linux i686) Gecko/20071127 Firefox/2.0.0.11")
@@ -722,13 +858,14 @@ class OctopusProvider(EcoProvider):
       req.add_header("Authorization", "Basic %s" % base64string)  
 
     try:
-      resp = urllib.request.urlopen(req).read()
+      resp = self.http_read(req)
       js = json.loads(resp)
 #      print(js)
       self.cached_data = js
-    except:
-      e = sys.exc_info()
+      self.store_cache(self.cached_data)
+    except Exception as e:
       print ("Exception: ", e)
+      self.set_error(e)
       data = None
 
   def get_data(self):
@@ -744,6 +881,9 @@ class AwattarProvider(EcoProvider):
   LABEL="awattar"
   URL_BASE = "https://api.awattar.{0}/v1/marketdata"
   FIELD_MAP = {EcoProvider.FIELD_PRICE: "marketprice"}
+  CACHE_TTL = 86400
+  # prices are published per local day
+  CACHE_LOCAL = True
   
   def __init__(self, config, glob_interval):
     EcoProvider.__init__(self, config, glob_interval)
@@ -764,7 +904,7 @@ class AwattarProvider(EcoProvider):
 
   def remap(self, jsdata):
     data = {}
-    ts = time.time() * 1000
+    ts = self.now() * 1000
 #    print(ts)
     tsrec = None
     for jsrec in jsdata:
@@ -774,21 +914,33 @@ class AwattarProvider(EcoProvider):
     if not tsrec:
       return None
 #    print(tsrec)
-    for k, v in self.FIELD_MAP.items():
-      data[k] = tsrec[v]
-    unit = tsrec['unit'].lower()   
-    data[EcoProvider.FIELD_PRICE] *= EcoProvider.PRICE_UNITS.get(unit, 1)  
-    data[EcoProvider.FIELD_PRICE] *= (1.0 + self.vat)
-    data[EcoProvider.FIELD_PRICE] += self.fixed_price
+    data[EcoProvider.FIELD_PRICE] = self.price_val(tsrec)
 #    print(data)
     return data
 
+  def price_val(self, jsrec):
+    p = jsrec[self.FIELD_MAP[EcoProvider.FIELD_PRICE]]
+    unit = jsrec['unit'].lower()   
+    p *= EcoProvider.PRICE_UNITS.get(unit, 1)  
+    p *= (1.0 + self.vat)
+    p += self.fixed_price
+    return p
+
+  def get_forecast(self, field, start, end):
+    if field != EcoProvider.FIELD_PRICE or not self.cached_data:
+      return None
+    records = [(float(r["start_timestamp"]) / 1000, float(r["end_timestamp"]) / 1000, self.price_val(r)) for r in self.cached_data]
+    return self.clip_forecast(records, start, end)
+
   def update_url(self):
     if self.country.lower() in ["de", "at"]:
       self.api_url = self.URL_BASE.format(self.country.lower())
     else:
       raise ValueError("Country not supported: " + self.country)
 
+  def cache_key(self):
+    return self.country.lower()
+
   def fetch_data(self):
     req = urllib.request.Request(self.api_url)
     req.add_header("User-Agent", "Mozilla/5.0 (X11; U; Linux i686) Gecko/20071127 Firefox/2.0.0.11")
@@ -796,12 +948,13 @@ class AwattarProvider(EcoProvider):
       req.add_header("auth-token", self.token)
 
     try:
-      resp = urllib.request.urlopen(req).read()
+      resp = self.http_read(req)
       js = json.loads(resp)
       self.cached_data = js['data']
-    except:
-      e = sys.exc_info()[0]
+      self.store_cache(self.cached_data)
+    except Exception as e:
       print ("Exception: ", e)
+      self.set_error(e)
       data = None
 
   def get_data(self):
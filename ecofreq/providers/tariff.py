@@ -0,0 +1,164 @@
+import re
+import bisect
+from math import ceil
+from datetime import datetime, timedelta
+
+from ecofreq.providers.common import EcoProvider
+
+class TariffProvider(EcoProvider):
+  LABEL="tariff"
+  DAYS = ["mon", "tue", "wed", "thu", "fri", "sat", "sun"]
+  HOLIDAY = "hol"
+  DATE_FORMAT = "%Y-%m-%d"
+  MIN_IN_DAY = 24 * 60
+  
+  def __init__(self, config, glob_interval):
+    EcoProvider.__init__(self, config, glob_interval)
+    self.set_config(config)
+
+  def info_string(self):
+    return "{0} (rules = {1}, horizon = {2} days)".format(type(self).__name__, len(self.rules), self.horizon)
+
+  def get_config(self):
+    cfg = super().get_config()
+    cfg["horizon"] = self.horizon
+    cfg.update(self.raw_cfg)
+    return cfg
+
+  def set_config(self, config):
+    self.horizon = int(config.get("horizon", 7))
+    self.raw_cfg = {}
+    for k in ["price", "index", "holidays"]:
+      if k in config:
+        self.raw_cfg[k] = config[k]
+    self.default = self.parse_value(self.raw_cfg.get("price", "") + ":" + self.raw_cfg.get("index", ""))
+    self.holidays = set()
+    for d in self.raw_cfg.get("holidays", "").split(","):
+      if d.strip():
+        self.holidays.add(datetime.strptime(d.strip(), self.DATE_FORMAT).date())
+    # rules are applied in order, i.e. later rules override earlier ones 
+    rule_keys = [k for k in config.keys() if re.fullmatch(r"rule\d+", k)]
+    self.rules = []
+    for k in sorted(rule_keys, key=lambda x: int(x[4:])):
+      self.raw_cfg[k] = config[k]
+      self.rules.append(self.parse_rule(config[k]))
+    self.table_start = self.table_end = 0
+
+  @classmethod
+  def parse_value(cls, s):
+    # <price>[:<index>]
+    price, _, index = s.partition(":")
+    price = float(price) if price.strip() else None
+    index = index.strip() if index.strip() else None
+    return (price, index)
+
+  @classmethod
+  def parse_time(cls, s):
+    h, m = s.strip().split(":")
+    return int(h) * 60 + int(m)
+
+  @classmethod
+  def parse_days(cls, s):
+    days = set()
+    for tok in s.lower().split(","):
+      tok = tok.strip()
+      if tok in ["all", "*"]:
+        days.update(cls.DAYS)
+        days.add(cls.HOLIDAY)
+      elif "-" in tok:
+        d1, d2 = [cls.DAYS.index(x) for x in tok.split("-")]
+        days.update(cls.DAYS[d1:d2+1] if d1 <= d2 else cls.DAYS[d1:] + cls.DAYS[:d2+1])
+      elif tok in cls.DAYS or tok == cls.HOLIDAY:
+        days.add(tok)
+      else:
+        raise ValueError("Tariff: invalid day specification: " + tok)
+    return days
+
+  @classmethod
+  def parse_rule(cls, s):
+    # <days> <HH:MM>-<HH:MM> = <price>[:<index>], e.g. mon-fri 07:00-20:00 = 40:peak
+    try:
+      lhs, rhs = s.split("=")
+      days, period = lhs.split()
+      t1, t2 = [cls.parse_time(x) for x in period.split("-")]
+      return (cls.parse_days(days), t1, t2, cls.parse_value(rhs))
+    except ValueError:
+      raise ValueError("Tariff: invalid rule: " + s)
+
+  def day_type(self, d):
+    return self.HOLIDAY if d in self.holidays else self.DAYS[d.weekday()]
+
+  def day_segments(self, d):
+    # split rules which wrap around midnight
+    dtype = self.day_type(d)
+    prev_dtype = self.day_type(d - timedelta(days=1))
+    spans = []
+    for days, t1, t2, val in self.rules:
+      if t1 < t2:
+        if dtype in days:
+          spans.append((t1, t2, val))
+      else:
+        if prev_dtype in days:
+          spans.append((0, t2, val))
+        if dtype in days:
+          spans.append((t1, self.MIN_IN_DAY, val))
+    bounds = sorted(set([0, self.MIN_IN_DAY] + [t for s in spans for t in s[:2]]))
+    segments = []
+    for m1, m2 in zip(bounds[:-1], bounds[1:]):
+      val = self.default
+      for t1, t2, v in spans:
+        if t1 <= m1 and m2 <= t2:
+          val = v
+      segments.append((m1, val))
+    return segments
+
+  def compile(self, ts, days):
+    # precompute interval table for [today, today + days) 
+    day = datetime.fromtimestamp(ts).date()
+    self.starts = []
+    self.values = []
+    for n in range(days):
+      d = day + timedelta(days=n)
+      midnight = datetime(d.year, d.month, d.day)
+      for m, val in self.day_segments(d):
+        if self.values and self.values[-1] == val:
+          continue
+        self.starts.append((midnight + timedelta(minutes=m)).timestamp())
+        self.values.append(val)
+    end = day + timedelta(days=days)
+    self.table_start = self.starts[0]
+    self.table_end = datetime(end.year, end.month, end.day).timestamp()
+
+  def check_table(self, start, end):
+    if self.table_start <= start < self.table_end and end <= self.table_end:
+      return
+    days = max(self.horizon, ceil((end - start) / 86400) + 1)
+    self.compile(start, days)
+
+  def lookup(self, ts):
+    self.check_table(ts, ts)
+    i = bisect.bisect_right(self.starts, ts) - 1
+    return self.values[i]
+
+  def get_data(self):
+    price, index = self.lookup(self.now())
+    data = {}
+    if price is not None:
+      data[self.FIELD_PRICE] = price
+    if index is not None:
+      data[self.FIELD_INDEX] = index
+    return data
+
+  def get_forecast(self, field, start, end):
+    if field not in [self.FIELD_PRICE, self.FIELD_INDEX]:
+      return None
+    self.check_table(start, end)
+    vidx = 0 if field == self.FIELD_PRICE else 1
+    i = max(bisect.bisect_right(self.starts, start) - 1, 0)
+    forecast = []
+    while i < len(self.starts) and self.starts[i] < end:
+      t1 = max(self.starts[i], start)
+      t2 = min(self.starts[i+1] if i + 1 < len(self.starts) else self.table_end, end)
+      forecast.append((t1, t2, self.values[i][vidx]))
+      i += 1
+    return forecast
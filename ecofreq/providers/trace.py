@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+
+import sys
+import json
+import mmap
+import struct
+import bisect
+import argparse
+from array import array
+from datetime import datetime
+
+from ecofreq.config import TS_FORMAT
+
+class CO2Trace(object):
+  FIELD_TS='ts'
+  FIELD_CO2='co2'
+  FIELD_FOSSIL_PCT='fossil_pct'
+  FIELD_PRICE='price'
+  FIELD_INDEX='index'
+  FIELDS=[FIELD_TS, FIELD_CO2, FIELD_FOSSIL_PCT, FIELD_PRICE, FIELD_INDEX]
+  # binary format: magic, header length (uint64), JSON header, one float64 array per field (NaN = NA)
+  MAGIC=b"EFTRACE1"
+  NA=float("nan")
+
+  def __init__(self):
+    self.rows = 0
+    self.columns = {}
+    self.index_labels = []
+    self.mm = None
+
+  @classmethod
+  def is_binary(cls, fname):
+    with open(fname, "rb") as f:
+      return f.read(len(cls.MAGIC)) == cls.MAGIC
+
+  @classmethod
+  def load(cls, fname):
+    trace = CO2Trace()
+    if cls.is_binary(fname):
+      trace.read_binary(fname)
+    else:
+      trace.read_tsv(fname)
+    return trace
+
+  def has_field(self, field):
+    return field in self.columns
+
+  def get(self, field, i):
+    v = self.columns[field][i] if field in self.columns else self.NA
+    return None if v != v else v
+
+  def get_index(self, i):
+    v = self.get(self.FIELD_INDEX, i)
+    return None if v is None else self.index_labels[int(v)]
+
+  def find(self, ts):
+    # last row with timestamp <= ts (first row if ts precedes the trace)
+    i = bisect.bisect_right(self.columns[self.FIELD_TS], ts) - 1
+    return max(i, 0)
+
+  def get_at(self, field, ts, interpolate=False):
+    i = self.find(ts)
+    v = self.get(field, i)
+    if interpolate and v is not None and i + 1 < self.rows:
+      t0 = self.get(self.FIELD_TS, i)
+      t1 = self.get(self.FIELD_TS, i + 1)
+      v1 = self.get(field, i + 1)
+      if v1 is not None and t0 <= ts < t1:
+        v += (v1 - v) * (ts - t0) / (t1 - t0)
+    return v
+
+  def read_tsv(self, fname):
+    def parse_float(s, factor=1.):
+      s = s.strip()
+      return self.NA if s == "NA" or not s else float(s) * factor
+
+    # headerless trace: CO2 [, fossil %]
+    ts_field = co2_field = 0
+    fossil_field = 1
+    price_field = index_field = -1
+    price_factor = 1
+    cols = {}
+    for field in self.FIELDS:
+      cols[field] = array('d')
+    with open(fname) as f:
+      for line in f:
+        if line.startswith("##"):
+          pass
+        elif line.startswith("#"):
+          toks = [x.strip() for x in line.replace("#", "", 1).split("\t")]
+          ts_field = toks.index('Timestamp') if 'Timestamp' in toks else -1
+          try:
+            co2_field = toks.index('CI [g/kWh]')
+          except ValueError:
+            co2_field = toks.index('gCO2/kWh')
+          try:
+            fossil_field = toks.index('Fossil [%]')
+          except ValueError:
+            fossil_field = -1
+          if 'Price/kWh' in toks:
+            price_field = toks.index('Price/kWh')
+            price_factor = 1
+          elif 'EUR/MWh'in toks:
+            price_field = toks.index('EUR/MWh')
+            price_factor = 0.1
+          else:
+            price_field = -1
+          if 'co2index' in toks:  
+            index_field = toks.index('co2index')
+          elif 'Index' in toks:
+            index_field = toks.index('Index')
+        else:  
+          toks = line.rstrip("\n").split("\t")
+          ts = self.NA
+          if ts_field >= 0 and ts_field < len(toks):
+            try:
+              ts = datetime.strptime(toks[ts_field].strip(), TS_FORMAT).timestamp()
+            except ValueError:
+              pass
+          cols[self.FIELD_TS].append(ts)
+          cols[self.FIELD_CO2].append(parse_float(toks[co2_field]))
+          for field, idx, factor in [(self.FIELD_FOSSIL_PCT, fossil_field, 1), (self.FIELD_PRICE, price_field, price_factor)]:
+            val = parse_float(toks[idx], factor) if idx >= 0 and idx < len(toks) else self.NA
+            cols[field].append(val)
+          index = self.NA
+          if index_field >= 0 and index_field < len(toks):
+            label = toks[index_field].strip()
+            if label != "NA":
+              if label not in self.index_labels:
+                self.index_labels.append(label)
+              index = self.index_labels.index(label)
+          cols[self.FIELD_INDEX].append(index)
+
+    self.rows = len(cols[self.FIELD_CO2])
+    if ts_field >= 0:
+      self.columns[self.FIELD_TS] = cols[self.FIELD_TS]
+    self.columns[self.FIELD_CO2] = cols[self.FIELD_CO2]
+    if fossil_field >= 0:
+      self.columns[self.FIELD_FOSSIL_PCT] = cols[self.FIELD_FOSSIL_PCT]
+    if price_field >= 0:
+      self.columns[self.FIELD_PRICE] = cols[self.FIELD_PRICE]
+    if index_field >= 0:
+      self.columns[self.FIELD_INDEX] = cols[self.FIELD_INDEX]
+
+  def write_binary(self, fname):
+    fields = [f for f in self.FIELDS if f in self.columns]
+    header = json.dumps({"rows": self.rows, "fields": fields, "index_labels": self.index_labels}).encode("utf-8")
+    # pad header so that data arrays are 8-byte aligned
+    header += b" " * (-len(header) % 8)
+    with open(fname, "wb") as f:
+      f.write(self.MAGIC)
+      f.write(struct.pack("<Q", len(header)))
+      f.write(header)
+      for field in fields:
+        col = array('d', self.columns[field])
+        if sys.byteorder == "big":
+          col.byteswap()
+        col.tofile(f)
+
+  def read_binary(self, fname):
+    if sys.byteorder == "big":
+      raise ValueError("Binary CO2 traces are not supported on big-endian systems")
+    with open(fname, "rb") as f:
+      self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    offset = len(self.MAGIC)
+    hlen = struct.unpack_from("<Q", self.mm, offset)[0]
+    offset += 8
+    header = json.loads(self.mm[offset:offset+hlen].decode("utf-8"))
+    offset += hlen
+    self.rows = header["rows"]
+    self.index_labels = header["index_labels"]
+    buf = memoryview(self.mm)
+    col_size = self.rows * 8
+    for field in header["fields"]:
+      self.columns[field] = buf[offset:offset+col_size].cast('d')
+      offset += col_size
+
+def parse_args():
+  parser = argparse.ArgumentParser(description="Convert TSV CO2/price trace into binary format for MockEcoProvider.")
+  parser.add_argument("tsv_fname", help="Input trace file (TSV)")
+  parser.add_argument("bin_fname", help="Output trace file (binary)")
+  return parser.parse_args()
+
+def main():
+  args = parse_args()
+  trace = CO2Trace()
+  trace.read_tsv(args.tsv_fname)
+  trace.write_binary(args.bin_fname)
+  print("Converted", trace.rows, "rows:", args.tsv_fname, "->", args.bin_fname)
+
+if __name__ == '__main__':
+  main()